@@ -1,19 +1,30 @@
+import time
+
+# Отсчет времени запуска - до импорта Qt и остальных модулей
+_START_TIME = time.perf_counter()
+
 import sys
 import configparser
-import threading
 import os
 import logging
 import subprocess  # Добавлено
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
                              QFrame, QProgressBar, QCheckBox, QComboBox, QSlider, QTableView, QMenu,
                              QApplication, QMessageBox, QFileDialog, QStyledItemDelegate, QAbstractItemView, QInputDialog)  # Добавлен QInputDialog
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QStandardItemModel, QStandardItem, QFont, QColor
-from subtitle_processor import analyze_phrases, generate_excerpts, generate_timestamps
-from utils import parse_srt
-import pysrt
+from PyQt5.QtCore import Qt, QTimer, QAbstractTableModel, QModelIndex, QThread, pyqtSignal
+from PyQt5.QtGui import QFont
+from subtitle_processor import (analyze_phrases, generate_timestamps, export_excerpts,
+                                AnalysisMemo, AnalysisCache, AnalysisCancelled)
+from utils import (InputLoader, CompiledText, CompiledPhrase, configure_lemma_cache, lemma_cache, warm_up_morph,
+                   is_morph_ready, get_morph, DEFAULT_STOP_WORDS, instrumentation, profiled, configure_matcher)
+import re
 from PyQt5.QtWidgets import QSizePolicy
 
+# Целевое время от запуска процесса до показа окна (мс); превышение пишется в лог
+STARTUP_TARGET_MS = 1500
+# Дополнительные стоп-слова (по одному в строке), необязательный файл рядом с программой
+STOP_WORDS_FILE = "stop_words.txt"
+
 class ComboBoxDelegate(QStyledItemDelegate):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -40,6 +51,262 @@ class ComboBoxDelegate(QStyledItemDelegate):
     def updateEditorGeometry(self, editor, option, index):
         editor.setGeometry(option.rect)
 
+class SelectionState:
+    """
+    Состояние выбора в таблице результатов: строки каждой фразы, раздел каждой строки
+    и число отмеченных строк по фразам. Переключение отметки стоит O(строк этой фразы),
+    число фраз с выбранным отрывком читается за O(1).
+    """
+
+    NO_SECTION, FULL, PARTIAL, NOT_FOUND, DUPLICATES = range(5)
+
+    def __init__(self):
+        self.rows_by_phrase = {}
+        self.sections = bytearray()  # Номер раздела для каждой строки
+        self.selected_counts = {}  # Фраза -> число отмеченных строк
+        self.selected_phrases = 0  # Фраз хотя бы с одной отмеченной строкой
+        self._section = self.NO_SECTION
+
+    def add_row(self, row, phrase, header_section, checkable, checked):
+        if header_section:
+            self._section = header_section
+        self.sections.append(self._section)
+        if checkable:
+            self.rows_by_phrase.setdefault(phrase, []).append(row)
+            if checked:
+                self.set_checked(phrase, True)
+
+    def set_checked(self, phrase, value):
+        count = self.selected_counts.get(phrase, 0)
+        if value:
+            self.selected_counts[phrase] = count + 1
+            if count == 0:
+                self.selected_phrases += 1
+        elif count:
+            if count == 1:
+                del self.selected_counts[phrase]
+                self.selected_phrases -= 1
+            else:
+                self.selected_counts[phrase] = count - 1
+
+    def is_exclusive(self, row):
+        """
+        В блоке "Ненайденные фразы" (и в строках после него) у фразы выбирается только один субтитр.
+        """
+        return self.sections[row] in (self.NOT_FOUND, self.DUPLICATES)
+
+class ResultsTableModel(QAbstractTableModel):
+    """
+    Таблица результатов на простых списках (по списку на колонку) вместо QStandardItem на каждую ячейку.
+    Строки-заголовки разделов хранятся множеством номеров, отметки "Выбрано?" - в bytearray.
+    Текст с выделением совпадающих слов считается в data() только для показываемых ячеек.
+    """
+
+    HEADERS = ["Фраза", "Субтитр", "Выбрано?", "Русская фраза"]
+    SECTIONS = ("Полностью совпадающие фразы", "Частично совпадающие фразы", "Ненайденные фразы",
+                "Дубли в фразах (информационно)")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.highlighter = None  # (фраза, субтитр) -> (фраза с выделением, субтитр с выделением)
+        self._bold_font = QFont()
+        self._bold_font.setBold(True)
+        self._reset_rows()
+
+    def _reset_rows(self):
+        self.phrases = []
+        self.texts = []
+        self.rus_phrases = []
+        self.cue_ids = []  # Номер субтитра в реестре или None
+        self.sort_keys = []
+        self.checked = bytearray()
+        self.checkable = bytearray()  # 0 - заголовок раздела или информационная строка
+        self.manual = bytearray()  # Строки, добавленные ручным поиском
+        self.headers = set()  # Номера строк-заголовков разделов
+        self.selection = SelectionState()
+        self._highlighted = {}
+
+    def _add_row(self, phrase, text, checked, rus_phrase, cue_id=None, sort_key=None, manual=False):
+        row = len(self.phrases)
+        is_header = phrase in self.SECTIONS
+        if is_header:
+            self.headers.add(row)
+        self.phrases.append(phrase)
+        self.texts.append(text)
+        self.rus_phrases.append(rus_phrase or "")
+        self.cue_ids.append(cue_id)
+        self.sort_keys.append(sort_key)
+        self.checked.append(1 if checked else 0)
+        self.checkable.append(0 if is_header or not (phrase or text) else 1)
+        self.manual.append(1 if manual else 0)
+        self.selection.add_row(row, phrase, self.SECTIONS.index(phrase) + 1 if is_header else 0,
+                               self.checkable[row], checked)
+
+    def set_rows(self, rows, highlighter=None):
+        """Замена всех строк: (фраза, субтитр, "Да"/"Нет", русская фраза[, номер субтитра])."""
+        self.clear()
+        self.highlighter = highlighter
+        self.append_rows(rows)
+
+    def append_rows(self, rows):
+        """Добавление строк одной вставкой (один beginInsertRows/endInsertRows на все строки)."""
+        rows = list(rows)
+        if not rows:
+            return
+        first = len(self.phrases)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        for row in rows:
+            self._add_row(str(row[0]), str(row[1]), row[2] == "Да", row[3] if len(row) > 3 else "",
+                          row[4] if len(row) > 4 else None)
+        self.endInsertRows()
+
+    def append_row(self, phrase, text, checked, rus_phrase, cue_id=None, sort_key=None, manual=False):
+        row = len(self.phrases)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._add_row(phrase, text, checked, rus_phrase, cue_id, sort_key, manual)
+        self.endInsertRows()
+        return row
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        for column in (self.phrases, self.texts, self.rus_phrases, self.cue_ids, self.sort_keys,
+                       self.checked, self.checkable, self.manual):
+            del column[row]
+        self.headers = {r if r < row else r - 1 for r in self.headers if r != row}
+        self._highlighted.clear()
+        self._rebuild_selection()
+        self.endRemoveRows()
+
+    def _rebuild_selection(self):
+        """Пересборка состояния выбора после удаления строки или правки фразы."""
+        self.selection = SelectionState()
+        for row, phrase in enumerate(self.phrases):
+            self.selection.add_row(row, phrase, self.SECTIONS.index(phrase) + 1 if row in self.headers else 0,
+                                   self.checkable[row], self.checked[row])
+
+    def clear(self):
+        self.beginResetModel()
+        self._reset_rows()
+        self.endResetModel()
+
+    def set_checked(self, row, value):
+        if self.checkable[row] and self.checked[row] != bool(value):
+            self.checked[row] = 1 if value else 0
+            self.selection.set_checked(self.phrases[row], value)
+            index = self.index(row, 2)
+            self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+
+    def set_cue(self, row, text, cue_id, sort_key):
+        """Новый субтитр строки (после сдвига таймкодов)."""
+        self.texts[row] = text
+        self.cue_ids[row] = cue_id
+        self.sort_keys[row] = sort_key
+        self._highlighted.pop(row, None)
+        self.dataChanged.emit(self.index(row, 0), self.index(row, 3))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.phrases)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def _highlight(self, row):
+        if row not in self._highlighted:
+            self._highlighted[row] = self.highlighter(self.phrases[row], self.texts[row])
+        return self._highlighted[row]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            if column == 2:
+                return ""
+            if role == Qt.DisplayRole and column < 2 and self.highlighter is not None and self.checkable[row]:
+                return self._highlight(row)[column]
+            return (self.phrases, self.texts, None, self.rus_phrases)[column][row]
+        if role == Qt.CheckStateRole and column == 2 and self.checkable[row]:
+            return Qt.Checked if self.checked[row] else Qt.Unchecked
+        if role == Qt.FontRole and row in self.headers:
+            return self._bold_font
+        if role == Qt.UserRole:
+            if column == 1:
+                return self.cue_ids[row]
+            if column == 2:
+                return self.sort_keys[row]
+        if role == Qt.UserRole + 1 and column == 2:
+            return bool(self.manual[row])  # Флаг ручного добавления
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid():
+            return False
+        row, column = index.row(), index.column()
+        if role == Qt.CheckStateRole and column == 2:
+            self.set_checked(row, value == Qt.Checked)
+            return True
+        if role == Qt.EditRole and column != 2:
+            (self.phrases, self.texts, None, self.rus_phrases)[column][row] = str(value)
+            self._highlighted.pop(row, None)
+            if column == 0:
+                self._rebuild_selection()
+            self.dataChanged.emit(index, index)
+            return True
+        return False
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsSelectable | Qt.ItemIsEnabled
+        if index.column() != 2:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+class TaskThread(QThread):
+    """
+    Фоновая задача GUI: функция func(task) выполняется вне потока интерфейса и не трогает виджеты,
+    а о ходе работы и результате сообщает сигналами. task.report подходит как обратный вызов progress
+    для analyze_phrases и генераторов: обновления отправляются не чаще PROGRESS_INTERVAL секунд,
+    а после requestInterruption() он возвращает True, и задача прерывается.
+    """
+
+    PROGRESS_INTERVAL = 0.1
+
+    progress_changed = pyqtSignal(int, int, int, float)  # Готово, всего, просмотрено субтитров, секунд
+    status_changed = pyqtSignal(str)
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, func, name="task", parent=None):
+        super().__init__(parent)
+        self.func = func
+        self.name = name  # Имя дампа профиля, если задан SUBTITLE_PROFILE
+        self._last_report = 0.0
+
+    def report(self, done, total, cues, elapsed):
+        now = time.perf_counter()
+        if done >= total or now - self._last_report >= self.PROGRESS_INTERVAL:
+            self._last_report = now
+            self.progress_changed.emit(done, total, cues, elapsed)
+        return self.isInterruptionRequested()
+
+    def run(self):
+        try:
+            with profiled(self.name):
+                result = self.func(self)
+        except AnalysisCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.succeeded.emit(result)
+
 class SubtitleFilterApp(QMainWindow):
 
 
@@ -68,9 +335,26 @@ class SubtitleFilterApp(QMainWindow):
         self.phrase_groups = {}
         self.phrase_order = []
         self.potential_count = 0
-        self.modified_subs = None  # Добавлено для хранения обновлённых субтитров
+        self.inputs = InputLoader()  # SRT, фразы и стоп-слова: читаются параллельно и кэшируются для всех задач
+        self.registry = None  # Субтитры текущего SRT, разобранные один раз за сессию (сдвиги таймкодов пишутся сюда)
+        self.corpus = None  # Подготовленные к поиску субтитры текущего SRT
+        self.selected_cue_ids = {}  # (фраза, текст) -> номер субтитра в реестре
+        self.analysis_memo = AnalysisMemo()  # Результаты по фразам: повторная проверка ищет только новые
+        self.analysis_cache_dir = None  # Папка кэша анализа в папке вывода (config.ini, [AnalysisCache])
+        self.analysis_cache_bytes = 20 * 1024 * 1024
+        self._sized_rows = set()  # Строки таблицы, высота которых уже подобрана по содержимому
+        self._task = None  # Текущая фоновая задача (TaskThread)
+        self._task_status = ""
+        self._rows_fit_contents = False  # Как флажок "Высота по содержимому" (по умолчанию снят)
+        self.startup_time_ms = None  # Время от запуска до показа окна
+        self.workers = 1  # Число процессов для поиска фраз (config.ini, [Performance])
+        self.use_sidecar = False  # Читать и записывать .sidx рядом с SRT (config.ini, [Performance])
         print("5. Переменные инициализированы")
 
+        # Словари pymorphy3 загружаются в фоне, пока строится интерфейс
+        warm_up_morph()
+        print("5a. Прогрев морфологического анализатора запущен")
+
         print("6. Запуск setup_gui...")
         self.setup_gui()
         print("7. setup_gui завершен")
@@ -84,15 +368,42 @@ class SubtitleFilterApp(QMainWindow):
         print("11. load_config завершен")
         print("=== ИНИЦИАЛИЗАЦИЯ ЗАВЕРШЕНА ===")
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.startup_time_ms is None:
+            # Замер после первой отрисовки окна
+            self.startup_time_ms = -1
+            QTimer.singleShot(0, self._report_startup_time)
+
+    def closeEvent(self, event):
+        # Поток задачи нельзя уничтожать вместе с окном, пока он работает: прерываем и дожидаемся его
+        if self._task is not None and self._task.isRunning():
+            self._task.requestInterruption()
+            self._task.wait()
+        self.inputs.shutdown()
+        super().closeEvent(event)
+
+    def _report_startup_time(self):
+        self.startup_time_ms = (time.perf_counter() - _START_TIME) * 1000
+        message = (f"Окно показано за {self.startup_time_ms:.0f} мс (цель {STARTUP_TARGET_MS} мс), "
+                   f"словари {'загружены' if is_morph_ready() else 'еще загружаются'}")
+        print(message)
+        if self.enable_logging.isChecked():
+            if self.startup_time_ms > STARTUP_TARGET_MS:
+                self.logger.warning(message)
+            else:
+                self.logger.info(message)
+
     def on_single_click(self, index):
         print(f"Single click on index: row={index.row()}, col={index.column()}")
-        if index.column() == 2:  # Колонка "Выбрано?"
-            current_state = self.table_model.data(index, Qt.CheckStateRole)
+        model = self.table_model
+        if index.column() == 2 and model.checkable[index.row()]:  # Колонка "Выбрано?"
+            current_state = model.data(index, Qt.CheckStateRole)
             print(f"Current state: {current_state}")
             new_state = Qt.CheckState.Unchecked if current_state == Qt.CheckState.Checked else Qt.CheckState.Checked
-            phrase = self.table_model.index(index.row(), 0).data()
+            phrase = model.phrases[index.row()]
             print(f"Switching state to {new_state} for phrase: {phrase}")
-            self._set_selection((phrase, self.table_model.index(index.row(), 1).data()), index.row(),
+            self._set_selection((phrase, model.texts[index.row()]), index.row(),
                                 new_state == Qt.CheckState.Checked)
     def center_window(self):
         """Центрирует окно на экране"""
@@ -220,6 +531,9 @@ class SubtitleFilterApp(QMainWindow):
             QPushButton("Найти вручную", clicked=self.manual_find_phrase),
             QPushButton("Изменить таймкоды", clicked=self.modify_timestamps)
         ]
+        self.cancel_button = QPushButton("Отмена", clicked=self.cancel_task)
+        self.cancel_button.setEnabled(False)
+        buttons.append(self.cancel_button)
 
         for button in buttons:
             button.setFixedSize(160, 30)  # Уменьшенный фиксированный размер
@@ -243,8 +557,7 @@ class SubtitleFilterApp(QMainWindow):
         # --- Таблица ---
         self.table_frame = QFrame()
         table_layout = QVBoxLayout(self.table_frame)
-        self.table_model = QStandardItemModel()
-        self.table_model.setHorizontalHeaderLabels(["Фраза", "Субтитр", "Выбрано?", "Русская фраза"])
+        self.table_model = ResultsTableModel()
 
         self.table_view = QTableView()
         self.table_view.setModel(self.table_model)
@@ -254,6 +567,9 @@ class SubtitleFilterApp(QMainWindow):
         self.table_view.customContextMenuRequested.connect(self.show_context_menu)
         self.table_view.setEditTriggers(QAbstractItemView.AllEditTriggers)
         self.table_view.clicked.connect(self.on_single_click)
+        self.table_view.doubleClicked.connect(self.on_double_click)
+        # Высота строк по содержимому подбирается для строк, которые становятся видимыми
+        self.table_view.verticalScrollBar().valueChanged.connect(self._resize_visible_rows)
         table_layout.addWidget(self.table_view)
 
         self.table_view.setStyleSheet("QTableView { margin: 0px; padding: 0px; border: 0px; }")
@@ -337,12 +653,30 @@ class SubtitleFilterApp(QMainWindow):
             self.table_view.update()
 
     def update_row_height(self):
-        if self.adjust_row_height.isChecked():
-            self.table_view.resizeRowsToContents()
+        self._sized_rows.clear()
+        self._rows_fit_contents = self.adjust_row_height.isChecked()
+        if self._rows_fit_contents:
+            self._resize_visible_rows()
         else:
             for row in range(self.table_model.rowCount()):
                 self.table_view.setRowHeight(row, 20)
 
+    def _resize_visible_rows(self, *args):
+        """Высота по содержимому только для видимых строк; каждая строка подбирается один раз."""
+        if not self._rows_fit_contents:
+            return
+        view = self.table_view
+        row = view.rowAt(0)
+        if row < 0:
+            row = 0
+        viewport_height = view.viewport().height()
+        row_count = self.table_model.rowCount()
+        while row < row_count and view.rowViewportPosition(row) < viewport_height:
+            if row not in self._sized_rows:
+                self._sized_rows.add(row)
+                view.resizeRowToContents(row)
+            row += 1
+
     def update_threshold(self, value):
         pass  # Логика обновления порога будет в check_phrases
 
@@ -390,18 +724,9 @@ class SubtitleFilterApp(QMainWindow):
 
     def load_config(self):
         print("Загрузка конфига...")
-        self.stop_words = set([
-            "the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by",
-            "is", "are", "was", "were", "be", "have", "has", "had", "do", "does", "did",
-            "will", "would", "shall", "should", "can", "could", "may", "might",
-            "don't", "won't", "can't", "didn't", "doesn't", "i'm", "you're", "he's", "she's", "it's",
-            "и", "в", "на", "с", "к", "у", "по", "из", "а", "но", "что", "это", "как", "для"
-        ])
-        if os.path.exists("stop_words.txt"):
-            with open("stop_words.txt", "r", encoding="utf-8") as f:
-                additional_stop_words = {word.strip().lower() for word in f.read().splitlines() if word.strip()}
-                self.stop_words.update(additional_stop_words)
-                print("Дополнительные стоп-слова загружены из stop_words.txt")
+        # Стоп-слова по умолчанию и из config.ini; stop_words.txt читается в фоне и добавляется в задачах
+        self.stop_words = set(DEFAULT_STOP_WORDS)
+        self.inputs.prefetch(('stop_words', STOP_WORDS_FILE))
         if os.path.exists("config.ini"):
             print("Файл config.ini найден")
             try:
@@ -414,9 +739,48 @@ class SubtitleFilterApp(QMainWindow):
                     self.path_vars[4].setText(self.config["Paths"].get("filename", "episodes"))
                 if "StopWords" in self.config:
                     self.stop_words.update(set(self.config["StopWords"].get("words", "").split(",")))
+                if "LemmaCache" in self.config:
+                    section = self.config["LemmaCache"]
+                    cache_path = None
+                    if section.getboolean("persist", fallback=False):
+                        # Файл кэша лежит рядом с config.ini
+                        cache_path = os.path.join(os.path.dirname(os.path.abspath("config.ini")),
+                                                  section.get("file", "lemma_cache.json"))
+                    configure_lemma_cache(section.getint("size", fallback=lemma_cache.maxsize), cache_path)
+                    print(f"Кэш лемм: {lemma_cache.stats()}")
+                if "Performance" in self.config:
+                    self.workers = self.config["Performance"].getint("workers", fallback=1)
+                    self.use_sidecar = self.config["Performance"].getboolean("sidecar", fallback=False)
+                    self.inputs.sidecar = self.use_sidecar
+                    try:
+                        configure_matcher(self.config["Performance"].get("matcher", "auto"))
+                    except ValueError as e:
+                        print(f"Ошибка в config.ini: {e}")
+                if "AnalysisCache" in self.config:
+                    section = self.config["AnalysisCache"]
+                    if section.getboolean("enabled", fallback=False):
+                        self.analysis_cache_dir = section.get("dir", ".analysis_cache")
+                        self.analysis_cache_bytes = section.getint("max_size_mb", fallback=20) * 1024 * 1024
             except Exception as e:
                 print(f"Ошибка при чтении конфига: {e}")
 
+    def _analysis_cache(self):
+        """Кэш анализа в папке вывода (или рядом с config.ini, если папка не задана); None, если выключен."""
+        if not self.analysis_cache_dir:
+            return None
+        base_dir = self.path_vars[3].text() or os.path.dirname(os.path.abspath("config.ini"))
+        return AnalysisCache(os.path.join(base_dir, self.analysis_cache_dir), self.analysis_cache_bytes)
+
+    def save_lemma_cache(self):
+        """Сохранение кэша лемм на диск (если включено в config.ini) и запись статистики в лог."""
+        try:
+            if lemma_cache.path:
+                lemma_cache.save()
+            if self.enable_logging.isChecked():
+                self.logger.info(f"Кэш лемм: {lemma_cache.stats()}")
+        except Exception as e:
+            print(f"Ошибка при сохранении кэша лемм: {e}")
+
     def save_config(self):
         if self.save_paths.isChecked():
             self.config["Paths"] = {
@@ -436,12 +800,14 @@ class SubtitleFilterApp(QMainWindow):
 
         row = index.row()
         model = self.table_model
-        phrase = model.index(row, 0).data()
-        subtitle_text = model.index(row, 1).data()
+        if not model.checkable[row]:
+            return
+        phrase = model.phrases[row]
+        subtitle_text = model.texts[row]
         key = (phrase, subtitle_text)
 
         # Проверяем, является ли строка ручной
-        is_manual = model.index(row, 2).data(Qt.UserRole + 1)
+        is_manual = model.manual[row]
 
         menu = QMenu()
         menu.addAction("Да", lambda: self._set_selection(key, row, True))
@@ -452,74 +818,159 @@ class SubtitleFilterApp(QMainWindow):
 
     def _set_selection(self, key, row, value):
         model = self.table_model
-        phrase = model.index(row, 0).data()
-        subtitle_text = model.index(row, 1).data()
-
-        # Собираем данные таблицы
-        data = [model.index(r, c).data() for r in range(model.rowCount()) for c in range(model.columnCount())]
-        data = [data[i:i + 3] for i in range(0, len(data), 3)]
-
-        # Проверяем, находится ли строка в блоке "Ненайденные фразы"
-        in_not_found_section = False
-        for i in range(row, -1, -1):
-            if data[i][0] == "Ненайденные фразы":
-                in_not_found_section = True
-                break
-            if data[i][0] in ["Полностью совпадающие фразы", "Частично совпадающие фразы"]:
-                break
-
-        if in_not_found_section and value:  # Если выбрано "Да" в блоке "Ненайденные фразы"
+        phrase = model.phrases[row]
+
+        if value and model.selection.is_exclusive(row):  # Если выбрано "Да" в блоке "Ненайденные фразы"
             # Снимаем выбор "Да" с других строк с той же фразой
-            for r, row_data in enumerate(data):
-                if row_data[0] == phrase and r != row:
-                    current_state = model.data(model.index(r, 2), Qt.CheckStateRole)
-                    if current_state == Qt.CheckState.Checked:
-                        model.setData(model.index(r, 2), Qt.CheckState.Unchecked, Qt.CheckStateRole)
+            for r in model.selection.rows_by_phrase.get(phrase, ()):
+                if r != row and model.checked[r]:
+                    model.set_checked(r, False)
+                    self.selected_matches[(phrase, model.texts[r])] = False
 
         # Обновляем текущее значение только для чекбокса, текст не трогаем
-        model.setData(model.index(row, 2), Qt.CheckState.Checked if value else Qt.CheckState.Unchecked,
-                      Qt.CheckStateRole)
+        model.set_checked(row, value)
 
         self.selected_matches[key] = value
         self.update_potential_count()
 
     def update_potential_count(self):
-        count = 0
-        selected_phrases = set()
-        for row in range(self.table_model.rowCount()):
-            phrase = self.table_model.index(row, 0).data()
-            choice = self.table_model.index(row, 2).data()
-            if phrase not in ["Полностью совпадающие фразы", "Частично совпадающие фразы", "Ненайденные фразы",
-                              "Дубли в фразах"] and choice.startswith("Субтитр"):
-                if phrase not in selected_phrases:
-                    selected_phrases.add(phrase)
-                    count += 1
+        # Число фраз с выбранным отрывком ведет модель таблицы при каждом переключении
+        count = self.table_model.selection.selected_phrases
         self.potential_count = count
         self.potential_label.setText(f"Потенциальных отрывков: {count}")
 
     def update_sorting(self):
         self.check_phrases()
 
-    def check_phrases(self):
-        self.status_label.setText("Проверка...")
+    def _start_task(self, func, status_text, on_success, error_message, on_finished=None, name="task"):
+        """
+        Запуск func(task) в TaskThread; одновременно выполняется только одна задача.
+        Замеры этапов (instrumentation) собираются заново для каждой задачи.
+        """
+        if self._task is not None:
+            # Вторая задача не запускается; строка состояния вернется к прогрессу текущей при следующем отчете
+            self.status_label.setText(f"Дождитесь завершения: {self._task_status}")
+            return False
+        self.is_running = True
+        self._task_status = status_text
+        self.status_label.setText(status_text)
         self.status_label.setStyleSheet("color: black")
-        threading.Thread(target=self._check_phrases_thread).start()
+        self.status_label.setToolTip("")
+        self.progress.setValue(0)
+        instrumentation.reset()
+
+        task = TaskThread(func, name, self)
+        task.progress_changed.connect(self._on_task_progress)
+        task.status_changed.connect(self._on_task_status)
+        task.succeeded.connect(lambda result: self._on_task_succeeded(result, on_success, name))
+        task.failed.connect(lambda message: self._on_task_failed(message, error_message))
+        task.cancelled.connect(self._on_task_cancelled)
+        task.finished.connect(lambda: self._on_task_finished(on_finished))
+        task.finished.connect(task.deleteLater)
+        self._task = task
+        self.cancel_button.setEnabled(True)
+        task.start()
+        return True
+
+    def cancel_task(self):
+        if self._task is not None and self._task.isRunning() and not self._task.isInterruptionRequested():
+            self._task.requestInterruption()
+            self.status_label.setText("Отмена...")
+
+    def _on_task_status(self, text):
+        self._task_status = text
+        self.status_label.setText(text)
+
+    def _on_task_progress(self, done, total, cues, elapsed):
+        self.progress.setMaximum(max(total, 1))
+        self.progress.setValue(done)
+        self.status_label.setText(f"{self._task_status} {done}/{total}, просмотрено субтитров: {cues}, "
+                                  f"{elapsed:.1f} с")
+
+    def _on_task_succeeded(self, result, on_success, name):
+        # Обработка результата идет в потоке интерфейса, поэтому профилируется отдельным дампом
+        with profiled(f"{name}_gui"):
+            on_success(result)
+
+    def _on_task_failed(self, message, error_message):
+        self.status_label.setText(f"Ошибка: {message}")
+        self.status_label.setStyleSheet("color: red")
+        if self.enable_logging.isChecked():
+            self.logger.error(f"{error_message}: {message}")
+
+    def _on_task_cancelled(self):
+        self.status_label.setText("Отменено")
+        self.status_label.setStyleSheet("color: black")
+        if self.enable_logging.isChecked():
+            self.logger.info(f"Отменено: {self._task_status}")
 
-    def _check_phrases_thread(self):
+    def _on_task_finished(self, on_finished=None):
+        self._task = None
+        self.is_running = False
+        self.cancel_button.setEnabled(False)
+        if on_finished is not None:
+            on_finished()
+        self._report_instrumentation()
+
+    def _report_instrumentation(self):
+        """Время этапов и счетчики последней задачи: в подсказку строки состояния и в лог."""
+        summary = instrumentation.summary()
+        if not summary:
+            return
+        self.status_label.setToolTip(summary)
+        if self.enable_logging.isChecked():
+            self.logger.info(f"Замеры ({self._task_status})\n{summary}")
+
+    def check_phrases(self):
+        srt_path, en_path, ru_path = (self.path_vars[i].text() for i in range(3))
+        analysis_cache = self._analysis_cache()
+        self._start_task(lambda task: self._check_phrases_thread(task, srt_path, en_path, ru_path, analysis_cache),
+                         "Проверка...", self._show_check_results, "Ошибка при проверке", name="check")
+
+    def _check_phrases_thread(self, task, srt_path, en_path, ru_path, analysis_cache=None):
+        """
+        Поиск фраз (в TaskThread): возвращает реестр субтитров и результат analyze_phrases.
+        Реестр становится текущим уже в потоке интерфейса (_show_check_results).
+        """
+        requests = [('srt', srt_path), ('phrases', en_path), ('phrases', ru_path), ('stop_words', STOP_WORDS_FILE)]
+        if analysis_cache is not None:
+            # SHA-1 файлов для отпечатка кэша анализа считаются вместе с загрузкой
+            requests += [('sha1', srt_path), ('sha1', en_path), ('sha1', ru_path)]
+        registry, english_phrases, russian_phrases, file_stop_words, *file_hashes = self.inputs.load(*requests)
+        subs = registry.store
+        corpus = registry.corpus()
+        stop_words = self.stop_words | file_stop_words
+        if not subs or not english_phrases or not russian_phrases:
+            raise ValueError("Файлы пусты или некорректны")
+
+        threshold = 0.5
+        # Неизмененная серия (SRT, фразы, порог, стоп-слова) берется из кэша анализа на диске
+        analysis = None
+        if analysis_cache is not None:
+            cache_key = AnalysisCache.fingerprint(srt_path, [en_path, ru_path], threshold, stop_words, file_hashes)
+            analysis = analysis_cache.load(cache_key, corpus.subtitles)
+        if analysis is None:
+            if not is_morph_ready():
+                # Ждем только если фоновый прогрев словарей еще не закончился
+                task.status_changed.emit("Загрузка словарей...")
+                get_morph()
+                task.status_changed.emit("Проверка...")
+            analysis = analyze_phrases(corpus, english_phrases, russian_phrases, threshold,
+                                       stop_words=stop_words, workers=self.workers, memo=self.analysis_memo,
+                                       progress=task.report)
+            if analysis_cache is not None:
+                analysis_cache.save(cache_key, analysis, corpus.subtitles)
+        return registry, analysis
+
+    def _show_check_results(self, result):
+        """Заполнение таблицы результатами проверки (в потоке интерфейса)."""
+        registry, analysis = result
+        self._use_registry(registry)
         try:
-            subs = parse_srt(self.path_vars[0].text())
-            with open(self.path_vars[1].text(), 'r', encoding='utf-8') as f_en:
-                english_phrases = [line.strip() for line in f_en if line.strip()]
-            with open(self.path_vars[2].text(), 'r', encoding='utf-8') as f_ru:
-                russian_phrases = [line.strip() for line in f_ru if line.strip()]
-            if not subs or not english_phrases or not russian_phrases:
-                raise ValueError("Файлы пусты или некорректны")
-
-            threshold = 0.5
-            analysis = analyze_phrases(subs, english_phrases, russian_phrases, threshold, stop_words=self.stop_words)
             self.phrase_order = analysis['phrase_order']
 
             self.selected_matches.clear()
+            self.selected_cue_ids.clear()
             self.phrase_groups.clear()
 
             full_matches_items = []
@@ -530,27 +981,36 @@ class SubtitleFilterApp(QMainWindow):
             for phrase, match in analysis['full_matches'].items():
                 key = (phrase, match['text'])
                 self.selected_matches[key] = True
+                self.selected_cue_ids[key] = match['subtitle'].id
                 full_matches_items.append(
-                    (phrase, match['text'], "Да", match['subtitle'].start.ordinal, match['rus_phrase']))
+                    (phrase, match['text'], "Да", match['subtitle'].start_ms, match['rus_phrase'],
+                     match['subtitle'].id))
 
             # Частичные совпадения
             for phrase, rus_phrase, matches in analysis['partial_matches']:
                 for match in matches:
                     key = (phrase, match['text'])
                     self.selected_matches[key] = False
-                    sort_key = match['subtitle'].start.ordinal if match['subtitle'] else 0
+                    sort_key = match['subtitle'].start_ms if match['subtitle'] else 0
+                    cue_id = match['subtitle'].id if match['subtitle'] else None
+                    self.selected_cue_ids[key] = cue_id
                     partial_matches_items.append(
-                        (phrase, match['text'], "Нет", sort_key, rus_phrase))
+                        (phrase, match['text'], "Нет", sort_key, rus_phrase, cue_id))
 
             # Ненайденные фразы
+            # Для фраз с общими словами показываются ближайшие субтитры, иначе - строка-заглушка
             for phrase, rus_phrase, best_matches in analysis['not_found']:
-                key = (phrase, "нет ни одного совпадающего слова")
-                self.selected_matches[key] = False
-                not_found_items.append(
-                    (phrase, "нет ни одного совпадающего слова", "Нет", 0, rus_phrase, key))
-                if phrase not in self.phrase_groups:
-                    self.phrase_groups[phrase] = {}
-                self.phrase_groups[phrase][key] = None
+                for match in best_matches:
+                    key = (phrase, match['text'])
+                    self.selected_matches[key] = False
+                    sort_key = match['subtitle'].start_ms if match['subtitle'] else 0
+                    cue_id = match['subtitle'].id if match['subtitle'] else None
+                    self.selected_cue_ids[key] = cue_id
+                    not_found_items.append(
+                        (phrase, match['text'], "Нет", sort_key, rus_phrase, key, cue_id))
+                    if phrase not in self.phrase_groups:
+                        self.phrase_groups[phrase] = {}
+                    self.phrase_groups[phrase][key] = None
 
             # Сортировка
             if self.sort_option.currentText() == "time":
@@ -566,15 +1026,17 @@ class SubtitleFilterApp(QMainWindow):
             data = [
                 ["Полностью совпадающие фразы", f"Кол-во: {len(full_matches_items)}", "", ""],
                 # Добавлена пустая строка для русской фразы
-                *[(phrase, text, selected, rus) for phrase, text, selected, _, rus in full_matches_items],
+                *[(phrase, text, selected, rus, cue_id)
+                  for phrase, text, selected, _, rus, cue_id in full_matches_items],
                 ["Частично совпадающие фразы", f"Кол-во: {len(partial_matches_items)}", "", ""],
                 # Добавлена пустая строка
-                *[(phrase, text, selected, rus) for phrase, text, selected, _, rus in partial_matches_items],
+                *[(phrase, text, selected, rus, cue_id)
+                  for phrase, text, selected, _, rus, cue_id in partial_matches_items],
                 ["Ненайденные фразы", f"Кол-во: {len(analysis['not_found'])}", "", ""],  # Добавлена пустая строка
             ]
             row_index = len(data)
-            for phrase, text, selected, _, rus_phrase, key in not_found_items:
-                data.append([phrase, text, selected, rus_phrase])
+            for phrase, text, selected, _, rus_phrase, key, cue_id in not_found_items:
+                data.append([phrase, text, selected, rus_phrase, cue_id])
                 if phrase in self.phrase_groups and key in self.phrase_groups[phrase]:
                     self.phrase_groups[phrase][key] = row_index
                 row_index += 1
@@ -601,12 +1063,10 @@ class SubtitleFilterApp(QMainWindow):
 
             if self.enable_logging.isChecked():
                 self.logger.info("Проверка завершена")
+            self.save_lemma_cache()
 
         except Exception as e:
-            self.status_label.setText(f"Ошибка: {e}")
-            self.status_label.setStyleSheet("color: red")
-            if self.enable_logging.isChecked():
-                self.logger.error(f"Ошибка при проверке: {e}")
+            self._on_task_failed(e, "Ошибка при проверке")
 
     def manual_find_phrase(self):
         """Функция для ручного поиска и добавления отрывка."""
@@ -619,16 +1079,16 @@ class SubtitleFilterApp(QMainWindow):
 
         phrase, ok = QInputDialog.getText(self, "Ручной поиск", "Введите текст отрывка, найденного вручную:")
         if ok and phrase:
-            subs = parse_srt(srt_path)
-            for sub in subs:
-                if phrase.lower() in sub.text.lower():
-                    key = (phrase, sub.text)
-                    self.selected_matches[key] = True
-                    self.phrase_groups[phrase] = {key: self.table_model.rowCount()}
-                    self._update_table_row(phrase, sub.text, "Да", sub.start.ordinal, "",
-                                           is_manual=True)  # Добавлен флаг
-                    QMessageBox.information(self, "Успех", f"Отрывок '{phrase}' добавлен с временем {sub.start}!")
-                    return
+            sub = self._load_registry().search(phrase)
+            if sub is not None:
+                key = (phrase, sub.text)
+                self.selected_matches[key] = True
+                self.selected_cue_ids[key] = sub.id
+                self.phrase_groups[phrase] = {key: self.table_model.rowCount()}
+                self._update_table_row(phrase, sub.text, "Да", sub.start_ms, "",
+                                       is_manual=True, cue_id=sub.id)  # Добавлен флаг
+                QMessageBox.information(self, "Успех", f"Отрывок '{phrase}' добавлен с временем {sub.start}!")
+                return
 
             key = (phrase, "Ручное добавление")
             self.selected_matches[key] = False
@@ -643,16 +1103,16 @@ class SubtitleFilterApp(QMainWindow):
         phrase, ok = QInputDialog.getText(self, "Ручной поиск", "Введите текст отрывка, найденного вручную:")
         if ok and phrase:
             # Поиск точного совпадения в субтитрах
-            subs = parse_srt(srt_path)
-            for sub in subs:
-                if phrase.lower() in sub.text.lower():
-                    # Добавляем в таблицу как полное совпадение
-                    key = (phrase, sub.text)
-                    self.selected_matches[key] = True
-                    self.phrase_groups[phrase] = {key: self.table_model.rowCount()}
-                    self._update_table_row(phrase, sub.text, "Да", sub.start.ordinal, "")
-                    QMessageBox.information(self, "Успех", f"Отрывок '{phrase}' добавлен с временем {sub.start}!")
-                    return
+            sub = self._load_registry().search(phrase)
+            if sub is not None:
+                # Добавляем в таблицу как полное совпадение
+                key = (phrase, sub.text)
+                self.selected_matches[key] = True
+                self.selected_cue_ids[key] = sub.id
+                self.phrase_groups[phrase] = {key: self.table_model.rowCount()}
+                self._update_table_row(phrase, sub.text, "Да", sub.start_ms, "", cue_id=sub.id)
+                QMessageBox.information(self, "Успех", f"Отрывок '{phrase}' добавлен с временем {sub.start}!")
+                return
 
             # Если совпадение не найдено, добавляем как частичное
             key = (phrase, "Ручное добавление")
@@ -662,221 +1122,150 @@ class SubtitleFilterApp(QMainWindow):
             QMessageBox.warning(self, "Предупреждение",
                                 f"Точное совпадение для '{phrase}' не найдено. Добавлено как ручное.")
 
-    def _update_table_row(self, phrase, text, selected, sort_key, rus_phrase, is_manual=False):
+    def _update_table_row(self, phrase, text, selected, sort_key, rus_phrase, is_manual=False, cue_id=None):
         """Обновление таблицы с новой строкой."""
-        row_position = self.table_model.rowCount()
-        self.table_model.insertRow(row_position)
-
-        phrase_item = QStandardItem(phrase)
-        text_item = QStandardItem(text)
-        selected_item = QStandardItem("")
-        rus_item = QStandardItem(rus_phrase if rus_phrase else "")
-
-        selected_item.setData(Qt.CheckState.Checked if selected == "Да" else Qt.CheckState.Unchecked, Qt.CheckStateRole)
-        selected_item.setEditable(False)
-        selected_item.setData(sort_key, Qt.UserRole)
-        selected_item.setData(is_manual, Qt.UserRole + 1)  # Флаг ручного добавления
-
-        self.table_model.setItem(row_position, 0, phrase_item)
-        self.table_model.setItem(row_position, 1, text_item)
-        self.table_model.setItem(row_position, 2, selected_item)
-        self.table_model.setItem(row_position, 3, rus_item)
-
-        self.table_view.resizeRowsToContents()
-        self.update_column_widths()
+        row = self.table_model.append_row(phrase, text, selected == "Да", rus_phrase, cue_id, sort_key, is_manual)
+        if self._rows_fit_contents:
+            self._sized_rows.add(row)
+            self.table_view.resizeRowToContents(row)
+        self.update_potential_count()
 
     def _update_table(self, data):
-        self.table_model.removeRows(0, self.table_model.rowCount())
-        # Обновляем заголовки, добавляя колонку для русских фраз
-        self.table_model.setHorizontalHeaderLabels(["Фраза", "Субтитр", "Выбрано?", "Русская фраза"])
-
-        for row in data:
-            # Создаём элементы строки
-            items = [QStandardItem(str(cell)) if i < 2 else QStandardItem("") for i, cell in enumerate(row[:3])]
-            # Добавляем русскую фразу, если она есть
-            if len(row) > 3:
-                items.append(QStandardItem(row[3] if row[3] else ""))
-            else:
-                items.append(QStandardItem(""))
-
-            if row[0] not in ["Полностью совпадающие фразы", "Частично совпадающие фразы", "Ненайденные фразы",
-                              "Дубли в фразах (информационно)"] and (row[0] or row[1]):
-                item = items[2]
-                item.setData(Qt.CheckState.Checked if row[2] == "Да" else Qt.CheckState.Unchecked, Qt.CheckStateRole)
-                item.setData("", Qt.DisplayRole)
-                item.setEditable(False)
-                if len(row) > 3 and isinstance(row[3], (int, float)):
-                    items[2].setData(row[3], Qt.UserRole)
-                if self.show_matches.isChecked():
-                    # Выделяем совпадающие слова
-                    phrase = row[0]
-                    subtitle = row[1]
-                    matched_words = self._get_matched_words(phrase, subtitle)
-                    phrase_html = self._highlight_words(phrase, matched_words)
-                    subtitle_html = self._highlight_words(subtitle, matched_words)
-                    items[0].setText(phrase_html)
-                    items[1].setText(subtitle_html)
-            self.table_model.appendRow(items)
-
-        for row in range(self.table_model.rowCount()):
-            if self.table_model.index(row, 0).data() in ["Полностью совпадающие фразы", "Частично совпадающие фразы",
-                                                         "Ненайденные фразы", "Дубли в фразах (информационно)"]:
-                for col in range(4):  # Обновлено до 4 колонок
-                    item = self.table_model.item(row, col)
-                    if item:
-                        font = QFont()
-                        font.setBold(True)
-                        item.setFont(font)
-
-        self.table_view.resizeColumnsToContents()
-        self.table_view.resizeRowsToContents()
-        self.table_view.doubleClicked.connect(self.on_double_click)
-        self.table_view.update()
-        self.update_column_widths()
+        with instrumentation.span('заполнение таблицы'):
+            # Выделение совпадающих слов считается моделью только для показываемых строк
+            highlighter = self._highlight_row if self.show_matches.isChecked() else None
+            self.table_model.set_rows(data, highlighter)
+
+            # Ширины колонок - пропорционально окну, высота по содержимому (если включена) - у видимых строк
+            self.update_column_widths()
+            self._sized_rows.clear()
+            self._rows_fit_contents = self.adjust_row_height.isChecked()
+            self._resize_visible_rows()
+            self.update_potential_count()
+
+    def _load_registry(self, srt_path=None):
+        """Реестр субтитров текущего SRT; файл разбирается заново, только если сменился или изменился."""
+        srt_path = srt_path if srt_path is not None else self.path_vars[0].text()
+        return self._use_registry(self.inputs.get('srt', srt_path))
+
+    def _use_registry(self, registry):
+        """
+        Реестр из InputLoader становится текущим (тот же объект, пока SRT не менялся).
+        Вызывается только в потоке интерфейса: self.corpus читается при подсветке строк таблицы.
+        """
+        if registry is not self.registry:
+            self.registry = registry
+            self.corpus = registry.corpus()
+            # SRT загружен, но .sidx не прочитан или не записан - только сообщение в лог
+            for error in registry.sidecar_errors:
+                print(error)
+                if self.enable_logging.isChecked():
+                    self.logger.warning(error)
+        return registry
+
+    def _highlight_row(self, phrase, subtitle):
+        """Фраза и субтитр с выделенными совпадающими словами."""
+        matched_words = self._get_matched_words(phrase, subtitle)
+        return self._highlight_words(phrase, matched_words), self._highlight_words(subtitle, matched_words)
+
+    def _get_matched_words(self, phrase, subtitle):
+        """Общие слова фразы и субтитра (по подготовленным текстам корпуса)."""
+        compiled_phrase = CompiledPhrase(phrase)
+        cue = self.corpus.lookup(subtitle) if self.corpus is not None else CompiledText(subtitle)
+        return compiled_phrase.word_set & cue.word_set
+
+    def _highlight_words(self, text, matched_words):
+        """Выделение совпадающих слов квадратными скобками."""
+        if not matched_words:
+            return text
+        return re.sub(r"[\w'-]+", lambda m: f"[{m.group()}]" if m.group().lower() in matched_words else m.group(),
+                      text)
 
     def on_double_click(self, index):
-        if index.column() == 2:  # Колонка "Выбор"
-            current_state = self.table_model.data(index, Qt.CheckStateRole)
+        model = self.table_model
+        if index.column() == 2 and model.checkable[index.row()]:  # Колонка "Выбор"
+            current_state = model.data(index, Qt.CheckStateRole)
             new_state = Qt.CheckState.Unchecked if current_state == Qt.CheckState.Checked else Qt.CheckState.Checked
-            phrase = self.table_model.index(index.row(), 0).data()
-            self._set_selection((phrase, self.table_model.index(index.row(), 1).data()), index.row(),
+            phrase = model.phrases[index.row()]
+            self._set_selection((phrase, model.texts[index.row()]), index.row(),
                                 new_state == Qt.CheckState.Checked)
 
     def find_excerpts(self):
         if not self.path_vars[0].text() or not self.path_vars[1].text():
             QMessageBox.critical(self, "Ошибка", "Укажите пути к файлам")
             return
-        self.is_running = True
-        self.status_label.setText("Поиск отрывков...")
-        self.status_label.setStyleSheet("color: black")
-        threading.Thread(target=self._find_excerpts_thread).start()
-
-    def _find_excerpts_thread(self):
-        try:
-            # Используем modified_subs, если доступен, иначе загружаем исходный файл
-            subs = self.modified_subs if self.modified_subs is not None else parse_srt(self.path_vars[0].text())
-            with open(self.path_vars[1].text(), 'r', encoding='utf-8') as f_en:
-                english_phrases = [line.strip() for line in f_en if line.strip()]
-            with open(self.path_vars[2].text(), 'r', encoding='utf-8') as f_ru:
-                russian_phrases = [line.strip() for line in f_ru if line.strip()]
-            threshold = 0.5
-            self.progress.setMaximum(len(english_phrases))
-
-            selected = {}
-            phrase_pairs = dict(zip(english_phrases, russian_phrases))
-
-            selected_phrases_with_time = []
-
-            for row in range(self.table_model.rowCount()):
-                phrase = self.table_model.index(row, 0).data()
-                choice = self.table_model.index(row, 2).data(Qt.CheckStateRole)
-                if phrase in ["Полностью совпадающие фразы", "Частично совпадающие фразы",
-                              "Ненайденные фразы", "Дубли в фразах"] or choice != Qt.CheckState.Checked:
-                    continue
-
-                subtitle_text = self.table_model.index(row, 1).data()
-                for sub in subs:
-                    if sub.text == subtitle_text:
-                        if phrase not in selected:
-                            selected[phrase] = []
-                        selected[phrase].append({'subtitle': sub, 'text': subtitle_text})
-                        selected_phrases_with_time.append((
-                            sub.start.ordinal,
-                            phrase,
-                            phrase_pairs.get(phrase, ""),
-                            sub
-                        ))
-                        break
-
-            selected_phrases_with_time.sort(key=lambda x: x[0])
-            selected_eng_phrases = [item[1] for item in selected_phrases_with_time]
-            selected_rus_phrases = [item[2] for item in selected_phrases_with_time]
-
-            selected_count = len(selected_eng_phrases)
-            filename = f"{self.path_vars[4].text()}_sub-{selected_count}"
-            output_dir = self.path_vars[3].text()
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            output_path = os.path.join(output_dir, f"Timestamps_{filename}.srt")
-            generate_excerpts(subs, english_phrases, threshold, output_path, selected)
-
-            rus_words_file = os.path.join(output_dir, f"russian_words_{filename}.txt")
-            with open(rus_words_file, 'w', encoding='utf-8') as f_rus:
-                for rus_phrase in selected_rus_phrases:
-                    f_rus.write(f"{rus_phrase}\n")
-
-            eng_words_file = os.path.join(output_dir, f"english_words_{filename}.txt")
-            with open(eng_words_file, 'w', encoding='utf-8') as f_eng:
-                for eng_phrase in selected_eng_phrases:
-                    f_eng.write(f"{eng_phrase}\n")
-
-            for i in range(len(english_phrases)):
-                self.progress.setValue(i + 1)
-                QApplication.processEvents()
-
-            self.status_label.setText("Отрывки найдены")
-            self.status_label.setStyleSheet("color: green")
-            if self.enable_logging.isChecked():
-                self.logger.info("Отрывки найдены")
-        except Exception as e:
-            self.status_label.setText(f"Ошибка: {e}")
-            self.status_label.setStyleSheet("color: red")
-            if self.enable_logging.isChecked():
-                self.logger.error(f"Ошибка при поиске отрывков: {e}")
-        finally:
-            self.is_running = False
-            self.save_config()
-            QApplication.processEvents()
+        # Отмеченные строки и пути собираются в потоке интерфейса, запись идет в TaskThread
+        model = self.table_model
+        rows = [(model.phrases[row], model.texts[row], model.cue_ids[row]) for row in range(model.rowCount())
+                if model.checkable[row] and model.checked[row]]
+        paths = [path_var.text() for path_var in self.path_vars]
+        self._start_task(lambda task: self._find_excerpts_thread(task, rows, *paths), "Поиск отрывков...",
+                         self._on_excerpts_found, "Ошибка при поиске отрывков", on_finished=self.save_config,
+                         name="excerpts")
+
+    def _find_excerpts_thread(self, task, rows, srt_path, en_path, ru_path, output_dir, name):
+        # Реестр хранит и сдвинутые таймкоды, файл заново не разбирается
+        registry, english_phrases, russian_phrases = self.inputs.load(
+            ('srt', srt_path), ('phrases', en_path), ('phrases', ru_path))
+        threshold = 0.5
+
+        phrase_pairs = dict(zip(english_phrases, russian_phrases))
+
+        selected_items = []
+        for phrase, subtitle_text, cue_id in rows:
+            sub = registry.resolve(cue_id, subtitle_text)
+            if sub is not None:
+                selected_items.append((phrase, phrase_pairs.get(phrase, ""), sub, subtitle_text))
+
+        return registry, export_excerpts(registry.store, selected_items, output_dir, name, english_phrases,
+                                         threshold, progress=task.report)
+
+    def _on_excerpts_found(self, result):
+        self._use_registry(result[0])
+        self.status_label.setText("Отрывки найдены")
+        self.status_label.setStyleSheet("color: green")
+        if self.enable_logging.isChecked():
+            self.logger.info("Отрывки найдены")
 
     def get_timestamps(self):
         if not self.path_vars[0].text() or not self.path_vars[1].text():
             QMessageBox.critical(self, "Ошибка", "Укажите пути к файлам")
             return
-        self.is_running = True
-        self.status_label.setText("Получение таймкодов...")
-        self.status_label.setStyleSheet("color: black")
-        threading.Thread(target=self._get_timestamps_thread).start()
-
-    def _get_timestamps_thread(self):
-        try:
-            subs = self.modified_subs if self.modified_subs is not None else parse_srt(self.path_vars[0].text())
-            with open(self.path_vars[1].text(), 'r', encoding='utf-8') as f:
-                phrases = [line.strip() for line in f if line.strip()]
-            threshold = self.match_threshold.value() / 100.0
-            self.progress.setMaximum(len(phrases))
-
-            selected = {}
-            for (phrase, subtitle_text), is_selected in self.selected_matches.items():
-                if is_selected:
-                    for sub in subs:
-                        if sub.text == subtitle_text:
-                            if phrase not in selected:
-                                selected[phrase] = []
-                            selected[phrase].append({'subtitle': sub, 'text': phrase})
-
-            selected_count = len([k for k, v in self.selected_matches.items() if v])
-            import re
-            clean_filename = re.sub(r'[^a-zA-Z0-9_-]', '', self.path_vars[3].text())
-            if not clean_filename:
-                clean_filename = "episodes"
-            filename = f"{clean_filename}_sub-{selected_count}"
-            output_path = os.path.join(self.path_vars[2].text(), f"FinalExcerpts_{filename}.srt")
-            generate_timestamps(subs, phrases, threshold, output_path, selected)
-            for i in range(len(phrases)):
-                self.progress.setValue(i + 1)
-                QApplication.processEvents()
-            self.status_label.setText("Таймкоды получены")
-            self.status_label.setStyleSheet("color: green")
-            if self.enable_logging.isChecked():
-                self.logger.info("Таймкоды получены")
-        except Exception as e:
-            self.status_label.setText(f"Ошибка: {e}")
-            self.status_label.setStyleSheet("color: red")
-            if self.enable_logging.isChecked():
-                self.logger.error(f"Ошибка при получении таймкодов: {e}")
-        finally:
-            self.is_running = False
-            self.save_config()
+        selected_rows = [(phrase, subtitle_text, self.selected_cue_ids.get((phrase, subtitle_text)))
+                         for (phrase, subtitle_text), is_selected in self.selected_matches.items() if is_selected]
+        threshold = self.match_threshold.value() / 100.0
+        clean_filename = re.sub(r'[^a-zA-Z0-9_-]', '', self.path_vars[4].text())
+        if not clean_filename:
+            clean_filename = "episodes"
+        output_path = os.path.join(self.path_vars[3].text(),
+                                   f"FinalExcerpts_{clean_filename}_sub-{len(selected_rows)}.srt")
+        srt_path, en_path = self.path_vars[0].text(), self.path_vars[1].text()
+        self._start_task(lambda task: self._get_timestamps_thread(task, selected_rows, srt_path, en_path, threshold,
+                                                                  output_path),
+                         "Получение таймкодов...", self._on_timestamps_ready, "Ошибка при получении таймкодов",
+                         on_finished=self.save_config, name="timestamps")
+
+    def _get_timestamps_thread(self, task, selected_rows, srt_path, en_path, threshold, output_path):
+        registry, phrases = self.inputs.load(('srt', srt_path), ('phrases', en_path))
+
+        selected = {}
+        for phrase, subtitle_text, cue_id in selected_rows:
+            sub = registry.resolve(cue_id, subtitle_text)
+            if sub is not None:
+                if phrase not in selected:
+                    selected[phrase] = []
+                selected[phrase].append({'subtitle': sub, 'text': phrase})
+
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        generate_timestamps(registry.corpus(), phrases, threshold, output_path, selected, progress=task.report)
+        return registry, output_path
+
+    def _on_timestamps_ready(self, result):
+        self._use_registry(result[0])
+        self.status_label.setText("Таймкоды получены")
+        self.status_label.setStyleSheet("color: green")
+        if self.enable_logging.isChecked():
+            self.logger.info("Таймкоды получены")
 
     def modify_timestamps(self):
         """Изменение таймкодов выбранных субтитров."""
@@ -885,8 +1274,8 @@ class SubtitleFilterApp(QMainWindow):
             QMessageBox.warning(self, "Ошибка", "Выберите хотя бы одну строку!")
             return
 
-        # Загружаем субтитры для модификации
-        subs = parse_srt(self.path_vars[0].text())
+        # Субтитры сессии: сдвиги накапливаются в реестре и используются при записи отрывков
+        registry = self._load_registry()
         # Запрашиваем количество секунд для начала и конца
         start_secs, ok1 = QInputDialog.getDouble(self, "Изменить таймкоды",
                                                  "Секунды в начало (положительное или отрицательное):", 0, -60, 60, 2)
@@ -898,37 +1287,16 @@ class SubtitleFilterApp(QMainWindow):
             return
 
         # Обрабатываем каждую выбранную строку
-        modified_subs = subs[:]  # Копируем список для модификации
-        modified_dict = {}  # Словарь для быстрого доступа к обновлённым субтитрам
+        model = self.table_model
         for row in selected_rows:
-            phrase = self.table_model.index(row, 0).data()
-            subtitle_text = self.table_model.index(row, 1).data()
-            key = (phrase, subtitle_text)
-
-            if phrase in ["Полностью совпадающие фразы", "Частично совпадающие фразы", "Ненайденные фразы",
-                          "Дубли в фразах (информационно)"]:
+            if row in model.headers:
                 continue
 
-            for sub in modified_subs:
-                if sub.text == subtitle_text:
-                    start_time = sub.start
-                    end_time = sub.end
-
-                    start_ms = start_time.ordinal + int(start_secs * 1000)
-                    end_ms = end_time.ordinal + int(end_secs * 1000)
-
-                    start_ms = max(0, start_ms)
-                    end_ms = max(start_ms + 1, end_ms)
-
-                    sub.start = pysrt.SubRipTime.from_ordinal(start_ms)
-                    sub.end = pysrt.SubRipTime.from_ordinal(end_ms)
-                    modified_dict[sub.index] = sub
-                    self.table_model.setItem(row, 1, QStandardItem(sub.text))
-                    self.table_model.item(row, 2).setData(sub.start.ordinal, Qt.UserRole)
-                    break
-
-        # Сохраняем обновлённый список
-        self.modified_subs = modified_subs
+            sub = registry.resolve(model.cue_ids[row], model.texts[row])
+            if sub is not None:
+                # Начало не меньше 0, конец позже начала
+                registry.store.shift([sub.id], int(start_secs * 1000), int(end_secs * 1000))
+                model.set_cue(row, sub.text, sub.id, sub.start_ms)
 
         QMessageBox.information(self, "Успех", f"Таймкоды изменены для {len(selected_rows)} строк!")
         if self.enable_logging.isChecked():
@@ -936,9 +1304,24 @@ class SubtitleFilterApp(QMainWindow):
                 f"Изменены таймкоды для {len(selected_rows)} строк: {start_secs} сек в начало, {end_secs} сек в конец")
 
 
+    def _delete_row(self, row, key, phrase):
+        """Удаление строки, добавленной ручным поиском."""
+        self.table_model.remove_row(row)
+        self._sized_rows.clear()
+        self._resize_visible_rows()
+        self.selected_matches.pop(key, None)
+        self.selected_cue_ids.pop(key, None)
+        if phrase in self.phrase_groups:
+            self.phrase_groups[phrase].pop(key, None)
+            if not self.phrase_groups[phrase]:
+                del self.phrase_groups[phrase]
+        self.update_potential_count()
+
     def clear_fields(self):
-        self.table_model.removeRows(0, self.table_model.rowCount())
+        self.table_model.clear()
+        self._sized_rows.clear()
         self.selected_matches.clear()
+        self.selected_cue_ids.clear()
         self.phrase_groups.clear()
         self.update_potential_count()
         self.status_label.setText("Очищено")
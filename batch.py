@@ -0,0 +1,188 @@
+"""
+Пакетная обработка сезона без GUI.
+
+Для каждого SRT в папке ищутся фразы, полные совпадения выбираются автоматически,
+а результаты пишутся так же, как кнопкой "Получить отрывки":
+Timestamps_*.srt, english_words_*.txt и russian_words_*.txt.
+
+Файлы фраз для серии Episode01.srt по умолчанию: Episode01.en.txt и Episode01.ru.txt.
+
+Пример:
+    python batch.py "Сезон 1" --output "Сезон 1/Результаты" --workers 4
+"""
+import argparse
+import configparser
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from subtitle_processor import analyze_phrases, export_excerpts
+from utils import (load_srt, read_phrases, read_stop_words, DEFAULT_STOP_WORDS, configure_lemma_cache,
+                   configure_matcher, lemma_cache)
+
+THRESHOLD = 0.5
+
+def load_settings(config_path="config.ini", stop_words_path="stop_words.txt"):
+    """Стоп-слова, параметры кэша лемм, способ сравнения и запись .sidx - из тех же файлов, что читает GUI."""
+    stop_words = set(DEFAULT_STOP_WORDS)
+    if os.path.exists(stop_words_path):
+        stop_words.update(read_stop_words(stop_words_path))
+
+    cache_size, cache_path, matcher, sidecar = None, None, "auto", False
+    if os.path.exists(config_path):
+        config = configparser.ConfigParser()
+        config.read(config_path, encoding='utf-8')
+        if "StopWords" in config:
+            stop_words.update(set(config["StopWords"].get("words", "").split(",")))
+        if "LemmaCache" in config:
+            section = config["LemmaCache"]
+            cache_size = section.getint("size", fallback=None)
+            if section.getboolean("persist", fallback=False):
+                cache_path = os.path.join(os.path.dirname(os.path.abspath(config_path)),
+                                          section.get("file", "lemma_cache.json"))
+        if "Performance" in config:
+            matcher = config["Performance"].get("matcher", "auto")
+            sidecar = config["Performance"].getboolean("sidecar", fallback=False)
+    return stop_words, cache_size, cache_path, matcher, sidecar
+
+def find_episodes(srt_dir, en_pattern, ru_pattern, phrases_dir=None):
+    """
+    Список серий (имя, SRT, английские фразы, русские фразы) и список пропущенных SRT,
+    для которых не нашлось файлов фраз.
+    """
+    phrases_dir = phrases_dir or srt_dir
+    episodes = []
+    skipped = []
+    for file_name in sorted(os.listdir(srt_dir)):
+        if not file_name.lower().endswith('.srt'):
+            continue
+        stem = os.path.splitext(file_name)[0]
+        en_path = os.path.join(phrases_dir, en_pattern.format(stem=stem))
+        ru_path = os.path.join(phrases_dir, ru_pattern.format(stem=stem))
+        if os.path.exists(en_path) and os.path.exists(ru_path):
+            episodes.append((stem, os.path.join(srt_dir, file_name), en_path, ru_path))
+        else:
+            skipped.append(file_name)
+    return episodes, skipped
+
+def process_episode(name, srt_path, en_path, ru_path, output_dir, stop_words, sidecar=False):
+    """
+    Обработка одной серии; возвращает сводку с замерами времени по этапам.
+    С sidecar=True субтитры и леммы берутся из .sidx рядом с SRT (и записываются туда при первом разборе).
+    """
+    start = time.perf_counter()
+    warnings = []
+    subs, corpus = load_srt(srt_path, sidecar, errors=warnings)
+    english_phrases = read_phrases(en_path)
+    russian_phrases = read_phrases(ru_path)
+    if not subs or not english_phrases or not russian_phrases:
+        raise ValueError("Файлы пусты или некорректны")
+    loaded = time.perf_counter()
+
+    analysis = analyze_phrases(corpus, english_phrases, russian_phrases, THRESHOLD,
+                               stop_words=stop_words)
+    analyzed = time.perf_counter()
+
+    # Как в GUI: полные совпадения отмечены "Да", остальные требуют ручного выбора
+    selected_items = [(phrase, match['rus_phrase'], match['subtitle'], match['text'])
+                      for phrase, match in analysis['full_matches'].items()]
+    export_excerpts(subs, selected_items, output_dir, name, english_phrases, THRESHOLD)
+    written = time.perf_counter()
+
+    return {
+        'name': name,
+        'cues': len(subs),
+        'phrases': analysis['total_unique_phrases'],
+        'full': len(analysis['full_matches']),
+        'partial': len(analysis['partial_matches']),
+        'not_found': len(analysis['not_found']),
+        'load': loaded - start,
+        'analyze': analyzed - loaded,
+        'write': written - analyzed,
+        'total': written - start,
+        'warnings': warnings
+    }
+
+def _init_worker(cache_size, cache_path, matcher):
+    configure_lemma_cache(cache_size, cache_path)
+    lemma_cache.take_new()  # Новые леммы возвращаются с каждой серией, кэш на диск пишет только родитель
+    configure_matcher(matcher)
+
+def _process_in_worker(*args):
+    """process_episode в процессе пула: сводка и леммы, вычисленные для этой серии."""
+    return process_episode(*args), lemma_cache.take_new()
+
+def _print_summary(summaries, errors, elapsed):
+    header = f"{'Серия':<30} {'Субт.':>6} {'Фраз':>5} {'Полн.':>5} {'Част.':>5} {'Нет':>5} " \
+             f"{'Загр.,с':>8} {'Поиск,с':>8} {'Запись,с':>8} {'Всего,с':>8}"
+    print(header)
+    print("-" * len(header))
+    for s in summaries:
+        print(f"{s['name'][:30]:<30} {s['cues']:>6} {s['phrases']:>5} {s['full']:>5} {s['partial']:>5} "
+              f"{s['not_found']:>5} {s['load']:>8.2f} {s['analyze']:>8.2f} {s['write']:>8.2f} {s['total']:>8.2f}")
+        for warning in s['warnings']:
+            print(f"{'':<30} {warning}")
+    for name, error in errors:
+        print(f"{name[:30]:<30} ОШИБКА: {error}")
+    print(f"Серий: {len(summaries)}, ошибок: {len(errors)}, общее время: {elapsed:.2f} с")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный поиск фраз по всем сериям в папке (без GUI)")
+    parser.add_argument("srt_dir", help="Папка с SRT-файлами серий")
+    parser.add_argument("-o", "--output", help="Папка вывода (по умолчанию <srt_dir>/output)")
+    parser.add_argument("-p", "--phrases-dir", help="Папка с файлами фраз (по умолчанию srt_dir)")
+    parser.add_argument("--en-pattern", default="{stem}.en.txt",
+                        help="Имя файла английских фраз для серии {stem} (по умолчанию %(default)s)")
+    parser.add_argument("--ru-pattern", default="{stem}.ru.txt",
+                        help="Имя файла русских фраз для серии {stem} (по умолчанию %(default)s)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="Число серий, обрабатываемых одновременно (по умолчанию %(default)s)")
+    parser.add_argument("--config", default="config.ini",
+                        help="Файл настроек (стоп-слова, кэш лемм, способ сравнения)")
+    args = parser.parse_args(argv)
+
+    output_dir = args.output or os.path.join(args.srt_dir, "output")
+    stop_words, cache_size, cache_path, matcher, sidecar = load_settings(args.config)
+    try:
+        configure_matcher(matcher)
+    except ValueError as e:
+        print(f"Ошибка в {args.config}: {e}")
+        return 1
+    episodes, skipped = find_episodes(args.srt_dir, args.en_pattern, args.ru_pattern, args.phrases_dir)
+    for file_name in skipped:
+        print(f"Пропущен {file_name}: нет файлов фраз")
+    if not episodes:
+        print("Серии для обработки не найдены")
+        return 1
+
+    start = time.perf_counter()
+    summaries = []
+    errors = []
+    configure_lemma_cache(cache_size, cache_path)
+    if args.workers > 1 and len(episodes) > 1:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(episodes)), initializer=_init_worker,
+                                 initargs=(cache_size, cache_path, matcher)) as executor:
+            futures = [(episode[0], executor.submit(_process_in_worker, *episode, output_dir, stop_words, sidecar))
+                       for episode in episodes]
+            for name, future in futures:
+                try:
+                    summary, lemmas = future.result()
+                    summaries.append(summary)
+                    lemma_cache.update(lemmas)
+                except Exception as e:
+                    errors.append((name, e))
+    else:
+        for episode in episodes:
+            try:
+                summaries.append(process_episode(*episode, output_dir, stop_words, sidecar))
+            except Exception as e:
+                errors.append((episode[0], e))
+    if cache_path:
+        lemma_cache.save()
+
+    _print_summary(summaries, errors, time.perf_counter() - start)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
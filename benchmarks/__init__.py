@@ -0,0 +1,8 @@
+"""
+Замеры скорости горячих путей: синтетические SRT и списки фраз (generator), прогон замеров (run)
+и сверка способов сравнения с эталоном difflib (parity).
+
+Пример:
+    python -m benchmarks.run --sizes 500 2000 --output results.json
+    python -m benchmarks.parity
+"""
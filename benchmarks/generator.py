@@ -0,0 +1,108 @@
+"""
+Детерминированный генератор синтетических субтитров и списков фраз для замеров.
+
+Одинаковые параметры и seed всегда дают одинаковые файлы, поэтому замеры разных версий
+кода сравнимы между собой.
+"""
+import os
+import random
+
+LATIN_WORDS = (
+    "house car dog run running runs walked walk money time friend friends tell told know knew think "
+    "thought going gone leave left right wrong night day morning kill killed mother father brother sister "
+    "police gun city street phone call called wait waiting hello world yes not out what where when why how "
+    "never always listen look looking find found help need want wanted believe remember forget door"
+).split()
+CYRILLIC_WORDS = (
+    "дом машина собака бежать деньги время друг друзья сказать знать думать идти уйти ночь день утро "
+    "мать отец брат сестра полиция город улица телефон звонить ждать привет мир да нет никогда всегда"
+).split()
+STOP_WORDS = "the a an and or but in on at to for of with by is are was i'm it's don't".split()
+MISSING_WORDS = "zzyx qwer blorp vrell quonk".split()
+
+def _sentence(rng, words_per_cue, cyrillic_ratio):
+    count = rng.randint(*words_per_cue)
+    words = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < cyrillic_ratio:
+            words.append(rng.choice(CYRILLIC_WORDS))
+        elif roll < cyrillic_ratio + (1 - cyrillic_ratio) * 0.35:
+            words.append(rng.choice(STOP_WORDS))
+        else:
+            words.append(rng.choice(LATIN_WORDS))
+    text = " ".join(words)
+    return text[0].upper() + text[1:] + rng.choice([".", "?", "!", "...", ","])
+
+def _format_time(ms):
+    return "%02d:%02d:%02d,%03d" % (ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000)
+
+def generate_cues(count, words_per_cue=(2, 9), cyrillic_ratio=0.1, duplicate_ratio=0.08, seed=1):
+    """
+    Тексты и таймкоды субтитров: список (начало мс, конец мс, текст).
+    duplicate_ratio - доля субтитров, повторяющих текст одного из предыдущих.
+    """
+    rng = random.Random(seed)
+    cues = []
+    ms = 1000
+    for _ in range(count):
+        if cues and rng.random() < duplicate_ratio:
+            text = rng.choice(cues)[2]
+        else:
+            text = _sentence(rng, words_per_cue, cyrillic_ratio)
+            if rng.random() < 0.3:
+                text += "\n" + _sentence(rng, words_per_cue, cyrillic_ratio)
+            if rng.random() < 0.05:
+                text = "- " + text
+        duration = rng.randint(800, 4000)
+        cues.append((ms, ms + duration, text))
+        ms += duration + rng.randint(0, 2000)
+    return cues
+
+def generate_phrases(cues, count, exact_ratio=0.4, partial_ratio=0.4, seed=1):
+    """
+    Английские и русские фразы: exact_ratio - куски текста субтитров (точные совпадения),
+    partial_ratio - куски с добавленными словами (частичные), остальные - фразы без совпадений.
+    """
+    rng = random.Random(seed)
+    english = []
+    for _ in range(count):
+        roll = rng.random()
+        words = rng.choice(cues)[2].replace("\n", " ").split()
+        start = rng.randint(0, len(words) - 1)
+        end = rng.randint(start + 1, len(words))
+        if roll < exact_ratio:
+            phrase = " ".join(words[start:end])
+        elif roll < exact_ratio + partial_ratio:
+            extra = [rng.choice(LATIN_WORDS) for _ in range(rng.randint(1, 3))]
+            phrase = " ".join(words[start:end] + extra)
+        else:
+            phrase = " ".join(rng.choice(MISSING_WORDS) for _ in range(rng.randint(2, 4)))
+        english.append(phrase.strip() or "x")
+    russian = [f"фраза {i}" for i in range(len(english))]
+    return english, russian
+
+def write_srt(path, cues):
+    with open(path, 'w', encoding='utf-8') as f:
+        for index, (start, end, text) in enumerate(cues, 1):
+            f.write(f"{index}\n{_format_time(start)} --> {_format_time(end)}\n{text}\n\n")
+    return path
+
+def write_lines(path, lines):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+def generate_episode(directory, cues=1000, phrases=None, seed=1, **options):
+    """
+    Серия в папке directory: episode.srt, episode.en.txt, episode.ru.txt (имена - как ждет batch.py).
+    options - параметры generate_cues и generate_phrases. Возвращает пути к трем файлам.
+    """
+    cue_options = {k: options[k] for k in ('words_per_cue', 'cyrillic_ratio', 'duplicate_ratio') if k in options}
+    phrase_options = {k: options[k] for k in ('exact_ratio', 'partial_ratio') if k in options}
+    cue_list = generate_cues(cues, seed=seed, **cue_options)
+    english, russian = generate_phrases(cue_list, phrases or max(1, cues // 4), seed=seed, **phrase_options)
+    os.makedirs(directory, exist_ok=True)
+    return (write_srt(os.path.join(directory, "episode.srt"), cue_list),
+            write_lines(os.path.join(directory, "episode.en.txt"), english),
+            write_lines(os.path.join(directory, "episode.ru.txt"), russian))
@@ -0,0 +1,153 @@
+"""
+Проверка, что все способы сравнения (utils.MATCHERS) дают те же результаты, что эталонный difflib:
+наибольший общий отрезок и LCS на случайных списках слов, find_matches на парах субтитр-фраза
+и analyze_phrases целиком на синтетических сериях. Полные и частичные совпадения analyze_phrases
+(с этапом точных совпадений, последовательно и в пуле процессов) сверяются и с последовательным поиском
+каждой фразы через difflib без этого этапа.
+
+Пример:
+    python -m benchmarks.parity --cases 20000 --sizes 500 2000
+"""
+import argparse
+import random
+import sys
+import tempfile
+
+from benchmarks.generator import generate_episode
+from subtitle_processor import analyze_phrases, _match_phrase
+from utils import (parse_srt, read_phrases, find_matches, create_matcher, SubtitleCorpus, DEFAULT_STOP_WORDS,
+                   DifflibMatcher, MATCHERS, np)
+
+THRESHOLDS = (0.5, 0.7)
+
+def _backends():
+    return [create_matcher(name) for name in MATCHERS if name != DifflibMatcher.name and (name != 'numpy' or np)]
+
+def _random_words(rng, vocabulary, low, high):
+    return [rng.choice(vocabulary) for _ in range(rng.randint(low, high))]
+
+def check_word_lists(matchers, cases, seed=1):
+    """Случайные списки слов (в том числе длиннее 199 слов, где у SequenceMatcher включается autojunk)."""
+    rng = random.Random(seed)
+    reference = DifflibMatcher()
+    mismatches = []
+    for case in range(cases):
+        vocabulary = "abcdefgh"[:rng.randint(1, 8)]
+        a = _random_words(rng, vocabulary, 0, 30)
+        b = _random_words(rng, vocabulary, 0, 250 if case % 100 == 0 else 20)
+        expected = (reference.longest_match(a, b), reference.lcs_length(a, b))
+        for matcher in matchers:
+            actual = (matcher.longest_match(a, b), matcher.lcs_length(a, b))
+            if actual != expected:
+                mismatches.append((matcher.name, 'words', a, b, expected, actual))
+    return mismatches
+
+def _episode(directory, size, seed):
+    srt_path, en_path, ru_path = generate_episode(f"{directory}/{size}", cues=size, seed=seed)
+    return parse_srt(srt_path), read_phrases(en_path), read_phrases(ru_path)
+
+def check_find_matches(matchers, subs, phrases, stop_words):
+    reference = DifflibMatcher()
+    mismatches = []
+    for i, phrase in enumerate(phrases):
+        text = subs[(i * 7919) % len(subs)].text
+        for threshold in THRESHOLDS:
+            expected = find_matches(text, phrase, threshold, stop_words, matcher=reference)
+            for matcher in matchers:
+                actual = find_matches(text, phrase, threshold, stop_words, matcher=matcher)
+                if actual != expected:
+                    mismatches.append((matcher.name, 'find_matches', text, phrase, expected, actual))
+    return mismatches
+
+def _analysis_key(analysis):
+    """Результат analyze_phrases без объектов субтитров (номер субтитра вместо него)."""
+    def match(m):
+        return (m['subtitle'].id if m['subtitle'] is not None else None, m['similarity'], m['text'])
+    return (
+        {phrase: match(m) for phrase, m in analysis['full_matches'].items()},
+        [(phrase, [match(m) for m in matches]) for phrase, _, matches in analysis['partial_matches']],
+        [(phrase, [match(m) for m in matches]) for phrase, _, matches in analysis['not_found']],
+        {phrase: [match(m) for m in matches] for phrase, matches in analysis['multiple_matches'].items()}
+    )
+
+def check_analysis(matchers, subs, english_phrases, russian_phrases, stop_words):
+    mismatches = []
+    for threshold in THRESHOLDS:
+        expected = _analysis_key(analyze_phrases(SubtitleCorpus(subs), english_phrases, russian_phrases,
+                                                 threshold, stop_words, matcher=DifflibMatcher()))
+        for matcher in matchers:
+            actual = _analysis_key(analyze_phrases(SubtitleCorpus(subs), english_phrases, russian_phrases,
+                                                   threshold, stop_words, matcher=matcher))
+            if actual != expected:
+                mismatches.append((matcher.name, 'analyze_phrases', len(subs), threshold, None, None))
+    return mismatches
+
+def _serial_analysis(subs, english_phrases, threshold, stop_words):
+    """
+    Полные и частичные совпадения последовательного поиска каждой фразы через difflib, без этапа
+    точных совпадений и без пула процессов - в том же виде, что дает _analysis_key.
+    """
+    corpus = SubtitleCorpus(subs)
+    unique_corpus = corpus.unique()
+    matcher = DifflibMatcher()
+    full_matches = {}
+    partial_matches = []
+    for phrase in dict.fromkeys(english_phrases):
+        matches, _ = _match_phrase(unique_corpus, phrase, threshold, stop_words, matcher=matcher)
+        keys = []
+        for sub_id, similarity in matches[:3]:
+            subtitle = corpus.subtitles[unique_corpus.positions[sub_id]]
+            keys.append((subtitle.id, similarity, subtitle.text))
+        if keys and keys[0][1] >= 0.95:
+            full_matches[phrase] = keys[0]
+        elif keys and keys[0][1] >= 0.5:
+            partial_matches.append((phrase, keys))
+    partial_matches.sort(key=lambda item: item[1][0][1], reverse=True)
+    return full_matches, partial_matches
+
+def check_serial(subs, english_phrases, russian_phrases, stop_words, workers=(None, 2)):
+    """full_matches и partial_matches analyze_phrases (последовательно и в пуле) против _serial_analysis."""
+    mismatches = []
+    for threshold in THRESHOLDS:
+        expected_full, expected_partial = _serial_analysis(subs, english_phrases, threshold, stop_words)
+        for count in workers:
+            actual_full, actual_partial = _analysis_key(analyze_phrases(
+                SubtitleCorpus(subs), english_phrases, russian_phrases, threshold, stop_words, workers=count,
+                matcher=DifflibMatcher()))[:2]
+            name = f"serial/workers={count or 1}"
+            for phrase in sorted(set(expected_full) | set(actual_full)):
+                if expected_full.get(phrase) != actual_full.get(phrase):
+                    mismatches.append((name, 'full_matches', phrase, threshold,
+                                       expected_full.get(phrase), actual_full.get(phrase)))
+            if actual_partial != expected_partial:
+                # Первое расхождение по порядку (или лишняя/недостающая фраза в конце списка)
+                tail = (expected_partial[len(actual_partial):][:1], actual_partial[len(expected_partial):][:1])
+                expected, actual = next(((e, a) for e, a in zip(expected_partial, actual_partial) if e != a), tail)
+                mismatches.append((name, 'partial_matches', len(subs), threshold, expected, actual))
+    return mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сверка способов сравнения с эталоном difflib")
+    parser.add_argument("--cases", type=int, default=20000, help="Случайных пар списков слов (по умолчанию %(default)s)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000],
+                        help="Размеры синтетических серий (по умолчанию %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed генератора (по умолчанию %(default)s)")
+    args = parser.parse_args(argv)
+
+    matchers = _backends()
+    stop_words = set(DEFAULT_STOP_WORDS)
+    mismatches = check_word_lists(matchers, args.cases, args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            subs, english_phrases, russian_phrases = _episode(directory, size, args.seed)
+            mismatches += check_find_matches(matchers, subs, english_phrases, stop_words)
+            mismatches += check_analysis(matchers, subs, english_phrases, russian_phrases, stop_words)
+            mismatches += check_serial(subs, english_phrases, russian_phrases, stop_words)
+
+    for name, check, a, b, expected, actual in mismatches[:20]:
+        print(f"{name} {check}: {a!r} / {b!r}: ожидалось {expected!r}, получено {actual!r}")
+    print(f"Способы: {', '.join(matcher.name for matcher in matchers)}; расхождений: {len(mismatches)}")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+Замеры горячих путей на синтетических сериях нескольких размеров с записью в JSON
+и сравнением с сохраненным базовым прогоном (benchmarks/baseline.json).
+
+Для каждой операции берется лучшее время из --repeat повторов. normalize_text
+замеряется с пустым кэшем лемм, остальные операции - с прогретым, как при повторных проверках в GUI.
+Таблица результатов GUI (заполнение и прокрутка --table-rows строк) замеряется без экрана
+(QT_QPA_PLATFORM=offscreen) и пропускается, если PyQt5 не установлен.
+
+Примеры:
+    python -m benchmarks.run                                  # размеры по умолчанию, сравнение с baseline.json
+    python -m benchmarks.run --sizes 500 5000 --output results.json
+    python -m benchmarks.run --save-baseline                  # записать результат как новый baseline.json
+    python -m benchmarks.run --strict                         # замедление относительно базы - код возврата 1
+
+baseline.json записан на одной машине, поэтому по умолчанию замедление относительно него -
+только предупреждение; --strict имеет смысл при сравнении прогонов на одной и той же машине.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.generator import generate_episode, generate_cues, generate_phrases
+from subtitle_processor import analyze_phrases, generate_excerpts, generate_timestamps
+from utils import (parse_srt, normalize_text, find_matches, calculate_exact_timestamps, calculate_timestamps_batch,
+                   load_srt, write_sidecar, read_phrases, SubtitleCorpus, DEFAULT_STOP_WORDS, lemma_cache, get_morph,
+                   configure_matcher, create_matcher, MATCHERS, np)
+
+VERSION = 1
+DEFAULT_SIZES = (500, 2000, 8000)
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+THRESHOLD = 0.5
+FIND_MATCHES_PAIRS = 2000
+TABLE_ROWS = 5000
+
+def _best_time(func, repeat, setup=None):
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def _selected_matches(analysis):
+    """Выбор, как в GUI: полные совпадения и все варианты частичных."""
+    selected = {phrase: [match] for phrase, match in analysis['full_matches'].items()}
+    for phrase, rus_phrase, matches in analysis['partial_matches']:
+        selected.setdefault(phrase, []).extend(matches)
+    return selected
+
+def bench_size(size, directory, repeat, seed=1):
+    """Замеры для серии из size субтитров; возвращает {операция: секунды}."""
+    srt_path, en_path, ru_path = generate_episode(os.path.join(directory, str(size)), cues=size, seed=seed)
+    english_phrases = read_phrases(en_path)
+    russian_phrases = read_phrases(ru_path)
+    stop_words = set(DEFAULT_STOP_WORDS)
+    subs = parse_srt(srt_path)
+    texts = [sub.text for sub in subs]
+    results = {}
+
+    results['parse_srt'] = _best_time(lambda: parse_srt(srt_path), repeat)
+    results['normalize_text'] = _best_time(lambda: [normalize_text(text) for text in texts], repeat,
+                                           setup=lemma_cache.clear)
+    write_sidecar(srt_path, subs)
+    results['load_sidecar'] = _best_time(lambda: load_srt(srt_path), repeat)
+    # То же без .sidx: разбор SRT, корпус и леммы всех субтитров (с пустым кэшем лемм, как при первом запуске)
+    results['load_parsed'] = _best_time(
+        lambda: [entry.lemma for entry in load_srt(srt_path, sidecar=False)[1].entries], repeat,
+        setup=lemma_cache.clear)
+
+    pairs = [(texts[(i * 7919) % len(texts)], english_phrases[i % len(english_phrases)])
+             for i in range(FIND_MATCHES_PAIRS)]
+    results['find_matches'] = _best_time(
+        lambda: [find_matches(text, phrase, THRESHOLD, stop_words) for text, phrase in pairs], repeat)
+
+    analysis = analyze_phrases(SubtitleCorpus(subs), english_phrases, russian_phrases, THRESHOLD, stop_words)
+    results['analyze_phrases'] = _best_time(
+        lambda: analyze_phrases(SubtitleCorpus(subs), english_phrases, russian_phrases, THRESHOLD, stop_words),
+        repeat)
+    # Тот же анализ с каждым способом сравнения (analyze_phrases выше - с выбранным --matcher)
+    for name in MATCHERS:
+        if name == 'numpy' and np is None:
+            continue
+        matcher = create_matcher(name)
+        results[f'analyze_phrases_{name}'] = _best_time(
+            lambda: analyze_phrases(SubtitleCorpus(subs), english_phrases, russian_phrases, THRESHOLD, stop_words,
+                                    matcher=matcher), repeat)
+
+    selected = _selected_matches(analysis)
+    selected_pairs = [(match['subtitle'], phrase) for phrase, matches in selected.items() for match in matches]
+    results['calculate_exact_timestamps'] = _best_time(
+        lambda: [calculate_exact_timestamps(sub, phrase) for sub, phrase in selected_pairs], repeat)
+    results['calculate_timestamps_batch'] = _best_time(
+        lambda: calculate_timestamps_batch(selected_pairs), repeat)
+
+    output_path = os.path.join(directory, f"out_{size}.srt")
+    results['generate_excerpts'] = _best_time(
+        lambda: generate_excerpts(subs, english_phrases, THRESHOLD, output_path, selected), repeat)
+    results['generate_timestamps'] = _best_time(
+        lambda: generate_timestamps(SubtitleCorpus(subs), english_phrases, THRESHOLD, output_path, selected),
+        repeat)
+    return results
+
+def _table_rows(count, seed=1):
+    """Строки таблицы, как их формирует _show_check_results: заголовок и (фраза, субтитр, выбор, рус., номер)."""
+    cues = generate_cues(count, seed=seed)
+    english, russian = generate_phrases(cues, count, seed=seed)
+    rows = [["Полностью совпадающие фразы", f"Кол-во: {count}", "", ""]]
+    rows += [(phrase, text, "Да" if i % 3 else "Нет", rus_phrase, i)
+             for i, (phrase, rus_phrase, (_, _, text)) in enumerate(zip(english, russian, cues))]
+    return rows[:count]
+
+def bench_table(rows, directory, repeat):
+    """
+    Заполнение таблицы GUI (_update_table) и прокрутка всех строк постранично - с высотой строк
+    по умолчанию и с флажком "Высота по содержимому". None, если PyQt5 не установлен.
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt5.QtWidgets import QApplication
+    except ImportError:
+        return None
+    qt_app = QApplication.instance() or QApplication(sys.argv[:1])
+    import app
+    cwd = os.getcwd()
+    os.chdir(directory)  # Окно читает config.ini и пишет лог в текущей папке
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # Отладочный вывод запуска окна
+            window = app.SubtitleFilterApp()
+    finally:
+        os.chdir(cwd)
+    window.show()
+    data = _table_rows(rows)
+    scroll_bar = window.table_view.verticalScrollBar()
+
+    def fill():
+        window._update_table(data)
+        qt_app.processEvents()
+
+    def scroll():
+        for value in range(0, scroll_bar.maximum() + 1, max(scroll_bar.pageStep(), 1)):
+            scroll_bar.setValue(value)
+            qt_app.processEvents()
+
+    def reset():
+        window.table_model.set_rows([])
+        window._update_table(data)
+        scroll_bar.setValue(0)
+        qt_app.processEvents()
+
+    results = {}
+    window.adjust_row_height.setChecked(False)
+    results[f'table_fill_{rows}'] = _best_time(fill, repeat)
+    results[f'table_scroll_{rows}'] = _best_time(scroll, repeat, setup=reset)
+    window.adjust_row_height.setChecked(True)
+    results[f'table_fill_fit_{rows}'] = _best_time(fill, repeat)
+    results[f'table_scroll_fit_{rows}'] = _best_time(scroll, repeat, setup=reset)
+    window.close()
+    return results
+
+def run(sizes, repeat=3, seed=1, matcher='auto', table_rows=TABLE_ROWS):
+    get_morph()  # Загрузка словарей не входит в замеры
+    matcher = configure_matcher(matcher)
+    with tempfile.TemporaryDirectory() as directory:
+        results = {str(size): bench_size(size, directory, repeat, seed) for size in sizes}
+        if table_rows:
+            table = bench_table(table_rows, directory, repeat)
+            if table is not None:
+                results['gui'] = table
+    return {
+        'version': VERSION,
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__ if np is not None else None,
+            'repeat': repeat,
+            'seed': seed,
+            'matcher': matcher.name
+        },
+        'results': results
+    }
+
+def compare(current, baseline, tolerance):
+    """Сравнение с базовым прогоном; возвращает список замедлившихся операций (размер, операция, во сколько раз)."""
+    regressions = []
+    header = f"{'Размер':>7} {'Операция':<28} {'База, с':>9} {'Сейчас, с':>10} {'Отношение':>9}"
+    print(header)
+    print("-" * len(header))
+    for size, ops in current['results'].items():
+        base_ops = baseline.get('results', {}).get(size, {})
+        for op, seconds in ops.items():
+            base = base_ops.get(op)
+            if base is None:
+                print(f"{size:>7} {op:<28} {'-':>9} {seconds:>10.4f} {'-':>9}")
+                continue
+            ratio = seconds / base if base else float('inf')
+            mark = " !" if ratio > 1 + tolerance else ""
+            print(f"{size:>7} {op:<28} {base:>9.4f} {seconds:>10.4f} {ratio:>8.2f}x{mark}")
+            if mark:
+                regressions.append((size, op, ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры скорости горячих путей на синтетических сериях")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Число субтитров в сериях (по умолчанию %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Повторов на операцию (по умолчанию %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed генератора (по умолчанию %(default)s)")
+    parser.add_argument("--matcher", default="auto", help="Способ сравнения, как в config.ini (по умолчанию %(default)s)")
+    parser.add_argument("--table-rows", type=int, default=TABLE_ROWS,
+                        help="Строк в замере таблицы GUI, 0 - без замера (по умолчанию %(default)s)")
+    parser.add_argument("-o", "--output", help="Файл для результатов в JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Базовый прогон для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Допустимое замедление относительно базы (по умолчанию %(default)s = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Записать результат как базовый прогон")
+    parser.add_argument("--strict", action="store_true",
+                        help="Замедление относительно базы - ошибка (код 1), а не предупреждение")
+    args = parser.parse_args(argv)
+
+    current = run(args.sizes, args.repeat, args.seed, args.matcher, args.table_rows)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"Базовый прогон записан в {args.baseline}")
+        return 0
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('version') != VERSION:
+            print(f"Базовый прогон {args.baseline} записан другой версией замеров, сравнение пропущено")
+            baseline = None
+    if baseline is None:
+        print(json.dumps(current['results'], indent=2))
+        return 0
+
+    base_meta = baseline.get('meta', {})
+    if base_meta.get('platform') != current['meta']['platform'] or base_meta.get('python') != current['meta']['python']:
+        print(f"База записана на другой машине или версии Python ({base_meta.get('platform')}, "
+              f"Python {base_meta.get('python')}): отношения времени ориентировочные")
+    regressions = compare(current, baseline, args.tolerance)
+    if regressions:
+        print(f"Замедлилось операций: {len(regressions)}")
+        if args.strict:
+            return 1
+        print("Предупреждение: без --strict замедление не считается ошибкой")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+"""
+Индекс субтитров всего сезона в SQLite (FTS5): в каких сериях и субтитрах встречается фраза.
+
+Для каждого SRT в папке хранятся текст субтитров, серия, начало и конец (мс) и лемматизированный
+текст. Индекс обновляется по изменившимся файлам: сначала сравниваются время изменения и размер,
+при расхождении - SHA-1 содержимого, и заново разбираются только действительно измененные серии.
+
+Примеры:
+    python season_index.py "Сезон 1"                             # обновить индекс
+    python season_index.py "Сезон 1" -s "I don't know"            # поиск фразы по всем сериям
+    python season_index.py "Сезон 1" -p Фразы_англ.txt Фразы_рус.txt    # проверка списка фраз по сезону
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+from subtitle_processor import analyze_phrases
+from utils import (parse_srt, normalize_text, find_matches, read_phrases, file_sha1, CueStore, CompiledText,
+                   CompiledPhrase, SubtitleCorpus, DEFAULT_STOP_WORDS)
+
+INDEX_FILE = "season_index.sqlite"
+
+class SeasonStore(CueStore):
+    """Субтитры всех серий в одном CueStore; для каждого субтитра хранится имя серии."""
+
+    def __init__(self, cues=()):
+        self.episodes = []
+        super().__init__(cues)
+
+    def append(self, index, start_ms, end_ms, text, episode=''):
+        self.episodes.append(episode)
+        return super().append(index, start_ms, end_ms, text)
+
+    def episode_of(self, subtitle):
+        return self.episodes[subtitle.id]
+
+class SeasonIndex:
+    """
+    Индекс SRT-файлов папки: таблица серий (имя файла, время изменения, размер, SHA-1)
+    и полнотекстовая таблица субтитров FTS5 по тексту и лемматизированному тексту.
+    """
+
+    VERSION = 1
+
+    def __init__(self, folder, path=None):
+        self.folder = folder
+        self.path = path or os.path.join(folder, INDEX_FILE)
+        self.connection = sqlite3.connect(self.path)
+        self._create()
+
+    def _create(self):
+        db = self.connection
+        if db.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+            # Индекс другой версии строится заново
+            db.executescript("DROP TABLE IF EXISTS episodes; DROP TABLE IF EXISTS cues;")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS episodes (
+                id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                sha1 TEXT NOT NULL,
+                cue_count INTEGER NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS cues USING fts5(
+                text, lemma, episode_id UNINDEXED, cue_index UNINDEXED, start_ms UNINDEXED, end_ms UNINDEXED
+            );
+        """)
+        db.execute(f"PRAGMA user_version = {self.VERSION}")
+        db.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, progress=None):
+        """
+        Обновление индекса по SRT-файлам папки. progress(имя серии, состояние) вызывается для каждой серии.
+        Возвращает {'added': [...], 'updated': [...], 'removed': [...], 'unchanged': [...]} с именами файлов.
+        """
+        db = self.connection
+        known = {name: (episode_id, mtime, size, sha1) for episode_id, name, mtime, size, sha1
+                 in db.execute("SELECT id, name, mtime, size, sha1 FROM episodes")}
+        report = {'added': [], 'updated': [], 'removed': [], 'unchanged': []}
+        names = sorted(name for name in os.listdir(self.folder) if name.lower().endswith('.srt'))
+        for name in names:
+            path = os.path.join(self.folder, name)
+            stat = os.stat(path)
+            row = known.get(name)
+            if row is not None and row[1] == stat.st_mtime and row[2] == stat.st_size:
+                report['unchanged'].append(name)
+                continue
+            sha1 = file_sha1(path).hex()
+            if row is not None and row[3] == sha1:
+                # Файл перезаписан без изменений - обновляются только время и размер
+                db.execute("UPDATE episodes SET mtime = ?, size = ? WHERE id = ?",
+                           (stat.st_mtime, stat.st_size, row[0]))
+                report['unchanged'].append(name)
+                continue
+            state = 'added' if row is None else 'updated'
+            if progress is not None:
+                progress(name, state)
+            self._index_episode(name, path, stat, sha1, row[0] if row is not None else None)
+            report[state].append(name)
+
+        for name in set(known) - set(names):
+            self._delete_episode(known[name][0])
+            report['removed'].append(name)
+        db.commit()
+        return report
+
+    def _delete_episode(self, episode_id):
+        self.connection.execute("DELETE FROM cues WHERE episode_id = ?", (episode_id,))
+        self.connection.execute("DELETE FROM episodes WHERE id = ?", (episode_id,))
+
+    def _index_episode(self, name, path, stat, sha1, episode_id=None):
+        store = parse_srt(path)
+        db = self.connection
+        if episode_id is not None:
+            self._delete_episode(episode_id)
+        cursor = db.execute("INSERT INTO episodes (name, mtime, size, sha1, cue_count) VALUES (?, ?, ?, ?, ?)",
+                            (name, stat.st_mtime, stat.st_size, sha1, len(store)))
+        episode_id = cursor.lastrowid
+        # Одинаковые тексты внутри серии лемматизируются один раз
+        lemmas = {}
+        rows = []
+        for cue_id in range(len(store)):
+            text = store.texts[cue_id]
+            if text not in lemmas:
+                lemmas[text] = normalize_text(text)
+            rows.append((text, lemmas[text], episode_id, store.indexes[cue_id], store.starts[cue_id],
+                         store.ends[cue_id]))
+        db.executemany("INSERT INTO cues (text, lemma, episode_id, cue_index, start_ms, end_ms) "
+                       "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def episodes(self):
+        """Список (имя файла, число субтитров) по алфавиту."""
+        return self.connection.execute("SELECT name, cue_count FROM episodes ORDER BY name").fetchall()
+
+    def corpus(self, episodes=None):
+        """
+        SubtitleCorpus по субтитрам сезона (или только серий episodes) с уже готовыми леммами из индекса;
+        subtitles корпуса - SeasonStore, серия субтитра - corpus.subtitles[i].store.episode_of(...).
+        """
+        query = ("SELECT e.name, cues.cue_index, cues.start_ms, cues.end_ms, cues.text, cues.lemma "
+                 "FROM cues JOIN episodes e ON e.id = cues.episode_id")
+        params = ()
+        if episodes:
+            query += f" WHERE e.name IN ({', '.join('?' * len(episodes))})"
+            params = tuple(episodes)
+        store = SeasonStore()
+        texts = {}
+        for name, cue_index, start_ms, end_ms, text, lemma in self.connection.execute(
+                query + " ORDER BY e.name, cues.rowid", params):
+            store.append(cue_index, start_ms, end_ms, text, name)
+            if text not in texts:
+                texts[text] = CompiledText(text, lemma)
+        return SubtitleCorpus(store, texts=texts)
+
+    def analyze(self, english_phrases, russian_phrases, threshold, stop_words=None, episodes=None, **options):
+        """
+        analyze_phrases по каждой серии сезона (или только сериям episodes): субтитры и леммы берутся
+        из индекса, SRT не разбираются. Дубли субтитров исключаются внутри серии, поэтому фраза,
+        которая повторяется в нескольких сериях, находится в каждой из них.
+        Возвращает {имя серии: результат analyze_phrases} по алфавиту серий.
+        """
+        names = [name for name, _ in self.episodes() if not episodes or name in episodes]
+        return {name: analyze_phrases(self.corpus([name]), english_phrases, russian_phrases, threshold,
+                                      stop_words=stop_words, **options)
+                for name in names}
+
+    def search(self, phrase, threshold=0.5, stop_words=None, limit=20):
+        """
+        Субтитры всех серий, похожие на фразу: кандидаты - субтитры с общими леммами (FTS5),
+        порядок - по схожести find_matches, при равенстве - по рангу bm25.
+        Возвращает список словарей: серия, номер, начало и конец (мс), текст, схожесть.
+        """
+        stop_words = stop_words or set()
+        compiled = CompiledPhrase(phrase)
+        tokens = compiled.lemma.split()
+        significant = [token for token in tokens if token not in stop_words] or tokens
+        if not significant:
+            return []
+        match_query = " OR ".join('"{}"'.format(token.replace('"', '""')) for token in dict.fromkeys(significant))
+        rows = self.connection.execute(
+            "SELECT e.name, cues.cue_index, cues.start_ms, cues.end_ms, cues.text, bm25(cues) "
+            "FROM cues JOIN episodes e ON e.id = cues.episode_id "
+            "WHERE cues MATCH ? ORDER BY bm25(cues)", (f"lemma : ({match_query})",))
+        results = []
+        for rank, (name, cue_index, start_ms, end_ms, text, score) in enumerate(rows):
+            similarity = find_matches(text, compiled, threshold, stop_words)[0]
+            if similarity >= threshold:
+                results.append({'episode': name, 'index': cue_index, 'start_ms': start_ms, 'end_ms': end_ms,
+                                'text': text, 'similarity': similarity, 'rank': rank})
+        results.sort(key=lambda result: (-result['similarity'], result['rank']))
+        return results[:limit]
+
+def _format_ms(ms):
+    return "%02d:%02d:%02d,%03d" % (ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000)
+
+def _print_analysis(analyses):
+    def describe(match):
+        sub = match['subtitle']
+        return f"#{sub.index} {_format_ms(sub.start_ms)} ({match['similarity']:.2f}): {match['text']!r}"
+
+    for name, analysis in analyses.items():
+        print(f"\n{name}")
+        for phrase, match in analysis['full_matches'].items():
+            print(f"[полное] {phrase}: {describe(match)}")
+            for other in analysis['multiple_matches'].get(phrase, [])[1:]:
+                print(f"         {' ' * len(phrase)}  {describe(other)}")
+        for phrase, rus_phrase, matches in analysis['partial_matches']:
+            print(f"[частичное] {phrase}:")
+            for match in matches:
+                print(f"    {describe(match)}")
+        for phrase, rus_phrase, matches in analysis['not_found']:
+            print(f"[не найдено] {phrase}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Индекс субтитров сезона (SQLite FTS5) и поиск фраз по всем сериям")
+    parser.add_argument("folder", help="Папка с SRT-файлами серий")
+    parser.add_argument("--index", help=f"Файл индекса (по умолчанию <folder>/{INDEX_FILE})")
+    parser.add_argument("-s", "--search", action="append", default=[], help="Фраза для поиска (можно несколько)")
+    parser.add_argument("-p", "--phrases", nargs=2, metavar=("EN", "RU"), help="Проверить файлы фраз по всему сезону")
+    parser.add_argument("-t", "--threshold", type=float, default=0.5, help="Порог схожести (по умолчанию %(default)s)")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="Результатов на фразу (по умолчанию %(default)s)")
+    args = parser.parse_args(argv)
+
+    stop_words = set(DEFAULT_STOP_WORDS)
+    with SeasonIndex(args.folder, args.index) as index:
+        report = index.update(progress=lambda name, state: print(f"Индексация {name} ({state})"))
+        print(f"Серий: {len(index.episodes())}, добавлено: {len(report['added'])}, "
+              f"обновлено: {len(report['updated'])}, удалено: {len(report['removed'])}")
+        for phrase in args.search:
+            print(f"\n{phrase}")
+            for result in index.search(phrase, args.threshold, stop_words, args.limit):
+                print(f"    {result['episode']} #{result['index']} {_format_ms(result['start_ms'])} "
+                      f"({result['similarity']:.2f}): {result['text']!r}")
+        if args.phrases:
+            english_phrases = read_phrases(args.phrases[0])
+            russian_phrases = read_phrases(args.phrases[1])
+            _print_analysis(index.analyze(english_phrases, russian_phrases, args.threshold, stop_words))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,333 @@
-from utils import parse_srt, normalize_text, find_matches, format_srt_entry, calculate_exact_timestamps, sort_subtitles_by_time
-import re
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from utils import (find_matches, format_srt_entry, calculate_timestamps_batch, SubtitleCorpus, CompiledPhrase,
+                   fingerprint_words, instrumentation, lemma_cache, get_matcher, file_sha1)
 
-def analyze_phrases(subtitles, english_phrases, russian_phrases, threshold, stop_words=None):
+# Сколько ближайших субтитров (с общими словами) показывать для ненайденной фразы
+NEAREST_CUES = 3
+
+class AnalysisCancelled(Exception):
+    """Операция прервана: обратный вызов progress вернул True."""
+
+class _Progress:
+    """
+    Ход операции для обратного вызова progress(готово, всего, просмотрено субтитров, прошло секунд).
+    Если вызов возвращает True, операция прерывается исключением AnalysisCancelled.
+    """
+
+    def __init__(self, callback, total):
+        self.callback = callback
+        self.total = total
+        self.done = 0
+        self.counters = {'cues': 0, 'pairs': 0}
+        self.start = time.perf_counter()
+
+    def advance(self, done=1):
+        self.done += done
+        if self.callback is not None and self.callback(self.done, self.total, self.counters['cues'],
+                                                       time.perf_counter() - self.start):
+            raise AnalysisCancelled()
+
+def _match_phrase(unique_corpus, eng_phrase, threshold, stop_words, counters=None, matcher=None):
+    """
+    Поиск одной фразы по корпусу без дублей.
+    Возвращает список (номер субтитра, схожесть) без дублей, по убыванию схожести,
+    и номера ближайших субтитров с общими словами (ищутся, только если совпадений нет).
+    counters['cues'] и counters['pairs'] увеличиваются на число сравненных с фразой субтитров-кандидатов.
+    matcher - способ сравнения слов (по умолчанию общий, см. utils.configure_matcher).
+    """
+    phrase = CompiledPhrase(eng_phrase)
+    matches = []
+    seen_texts = set()
+
+    # Поиск совпадений по субтитрам-кандидатам из индекса
+    candidates = unique_corpus.candidates(phrase, threshold, stop_words)
+    if counters is not None:
+        counters['cues'] += len(candidates)
+        counters['pairs'] += len(candidates)
+    if candidates and phrase.words:
+        # Длины общих отрезков для всех кандидатов считаются сразу (маски фразы и т.п. готовятся один раз)
+        runs = (matcher or get_matcher()).longest_runs(unique_corpus, phrase, candidates)
+        for sub_id, run in zip(candidates, runs):
+            entry = unique_corpus.entries[sub_id]
+            if phrase.clean in entry.clean:
+                similarity = 1.0
+            else:
+                similarity = run / len(phrase.words)
+                if similarity < threshold:
+                    continue
+            if similarity >= 0.5 and entry.text not in seen_texts:
+                matches.append((sub_id, similarity))
+                seen_texts.add(entry.text)
+    else:
+        for sub_id in candidates:
+            similarity, matched_phrase, matched_text = find_matches(unique_corpus.entries[sub_id], phrase,
+                                                                    threshold, stop_words, matcher=matcher)
+            if similarity >= 0.5 and matched_text not in seen_texts:
+                matches.append((sub_id, similarity))
+                seen_texts.add(matched_text)
+
+    # Сортируем совпадения по убыванию схожести
+    matches.sort(key=lambda x: x[1], reverse=True)
+
+    if not matches:
+        # Ближайшие субтитры: есть общие слова длиннее 2 букв (по индексу слов корпуса)
+        with instrumentation.span('ближайшие субтитры'):
+            return [], unique_corpus.overlapping_cues(phrase, stop_words, NEAREST_CUES)
+
+    # Удаляем дубли совпадений
+    unique_matches = []
+    seen_texts.clear()
+    for sub_id, similarity in matches:
+        norm_text = unique_corpus.entries[sub_id].lemma
+        if norm_text not in seen_texts:
+            seen_texts.add(norm_text)
+            unique_matches.append((sub_id, similarity))
+    return unique_matches, []
+
+def _exact_matches(unique_corpus, sub_ids):
+    """Точные совпадения фразы (схожесть 1.0) в том же виде, что возвращает _match_phrase."""
+    unique_matches = []
+    seen_texts = set()
+    seen_lemmas = set()
+    for sub_id in sub_ids:
+        entry = unique_corpus.entries[sub_id]
+        if entry.text in seen_texts or entry.lemma in seen_lemmas:
+            continue
+        seen_texts.add(entry.text)
+        seen_lemmas.add(entry.lemma)
+        unique_matches.append((sub_id, 1.0))
+    return unique_matches, []
+
+# Корпус и параметры поиска в процессе-исполнителе: передаются один раз при запуске процесса
+_worker_state = None
+
+def _init_worker(unique_corpus, threshold, stop_words, matcher=None):
+    global _worker_state
+    _worker_state = (unique_corpus, threshold, stop_words, matcher)
+
+def _match_phrase_chunk(phrases):
+    """Поиск порции фраз в процессе-исполнителе; замеры этапов возвращаются вместе с результатом."""
+    unique_corpus, threshold, stop_words, matcher = _worker_state
+    counters = {'cues': 0, 'pairs': 0}
+    instrumentation.reset()
+    lookups = lemma_cache.lookups
+    outcomes = [_match_phrase(unique_corpus, phrase, threshold, stop_words, counters, matcher)
+                for phrase in phrases]
+    counters['lemmas'] = lemma_cache.lookups - lookups
+    return outcomes, counters, instrumentation.snapshot()
+
+def _match_phrases_parallel(unique_corpus, phrases, threshold, stop_words, workers, tracker=None, matcher=None):
+    """
+    Поиск фраз в пуле процессов; результаты возвращаются в исходном порядке фраз.
+    О ходе поиска tracker (_Progress) узнает после каждой готовой порции.
+    Время этапов в процессах суммируется в instrumentation (процессорное время всех исполнителей).
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    # Несколько порций на процесс, чтобы медленные фразы не задерживали весь пул
+    chunk_size = max(1, -(-len(phrases) // (workers * 4)))
+    chunks = [phrases[i:i + chunk_size] for i in range(0, len(phrases), chunk_size)]
+    outcomes = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(unique_corpus, threshold, stop_words, matcher)) as executor:
+        futures = {executor.submit(_match_phrase_chunk, chunk): chunk for chunk in chunks}
+        try:
+            for future in as_completed(futures):
+                chunk_outcomes, counters, snapshot = future.result()
+                outcomes.update(zip(futures[future], chunk_outcomes))
+                instrumentation.merge(snapshot)
+                if tracker is not None:
+                    for name, value in counters.items():
+                        tracker.counters[name] = tracker.counters.get(name, 0) + value
+                    tracker.advance(len(chunk_outcomes))
+        except AnalysisCancelled:
+            # Еще не начатые порции не запускаются
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return {phrase: outcomes[phrase] for phrase in phrases}
+
+class AnalysisMemo:
+    """
+    Результаты поиска отдельных фраз между проверками: при повторной проверке
+    ищутся только новые и измененные фразы, остальные берутся отсюда.
+    Ключ - (хэш текстов субтитров, порог, хэш стоп-слов) и фраза; номера субтитров
+    хранятся в нумерации полного корпуса, поэтому не зависят от корпуса без дублей.
+    """
+
+    def __init__(self, maxsize=20000):
+        self.maxsize = maxsize
+        self._outcomes = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def scope(corpus, threshold, stop_words):
+        return corpus.fingerprint(), float(threshold), fingerprint_words(stop_words)
+
+    def get(self, scope, phrase):
+        key = (scope, phrase)
+        with self._lock:
+            outcome = self._outcomes.get(key)
+            if outcome is None:
+                self.misses += 1
+                return None
+            self._outcomes.move_to_end(key)
+            self.hits += 1
+            return outcome
+
+    def put(self, scope, phrase, outcome):
+        key = (scope, phrase)
+        with self._lock:
+            self._outcomes[key] = outcome
+            self._outcomes.move_to_end(key)
+            while len(self._outcomes) > self.maxsize:
+                self._outcomes.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._outcomes.clear()
+            self.hits = 0
+            self.misses = 0
+
+class AnalysisCache:
+    """
+    Результаты analyze_phrases на диске: повторная проверка той же серии после перезапуска
+    не ищет фразы заново. Файл кэша называется по отпечатку SRT, файлов фраз, порога
+    и стоп-слов; субтитры хранятся номерами в SRT. При превышении max_bytes удаляются
+    давно не использованные файлы.
+    """
+
+    VERSION = 1
+
+    def __init__(self, directory, max_bytes=20 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def fingerprint(cls, srt_path, phrase_paths, threshold, stop_words, file_hashes=None):
+        """file_hashes - уже посчитанные SHA-1 файлов (например, InputLoader), иначе файлы читаются здесь."""
+        digest = hashlib.sha1(f"v{cls.VERSION}|{float(threshold)!r}|{fingerprint_words(stop_words)}".encode('utf-8'))
+        for file_hash in file_hashes or map(file_sha1, [srt_path, *phrase_paths]):
+            digest.update(file_hash)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key, subtitles):
+        """Результат analyze_phrases для отпечатка key или None; subtitles - субтитры того же SRT."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != self.VERSION:
+                os.remove(path)
+                return None
+            os.utime(path)  # Отметка использования для вытеснения
+
+            def match(item):
+                item = dict(item)
+                item['subtitle'] = subtitles[item['subtitle']] if item['subtitle'] is not None else None
+                return item
+
+            analysis = data['analysis']
+            return {
+                'full_matches': {phrase: match(item) for phrase, item in analysis['full_matches']},
+                'partial_matches': [(phrase, rus, [match(item) for item in items])
+                                    for phrase, rus, items in analysis['partial_matches']],
+                'not_found': [(phrase, rus, [match(item) for item in items])
+                              for phrase, rus, items in analysis['not_found']],
+                'duplicates': dict(analysis['duplicates']),
+                'multiple_matches': {phrase: [match(item) for item in items]
+                                     for phrase, items in analysis['multiple_matches']},
+                'total_unique_phrases': analysis['total_unique_phrases'],
+                'phrase_order': analysis['phrase_order']
+            }
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"Ошибка при загрузке кэша анализа: {e}")
+            return None
+
+    def save(self, key, analysis, subtitles):
+        """Запись результата analyze_phrases; subtitles - список, по которому считаются номера субтитров."""
+        positions = {id(sub): position for position, sub in enumerate(subtitles)}
+
+        def match(item):
+            item = dict(item)
+            item['subtitle'] = positions[id(item['subtitle'])] if item['subtitle'] is not None else None
+            return item
+
+        data = {
+            'version': self.VERSION,
+            'analysis': {
+                'full_matches': [(phrase, match(item)) for phrase, item in analysis['full_matches'].items()],
+                'partial_matches': [(phrase, rus, [match(item) for item in items])
+                                    for phrase, rus, items in analysis['partial_matches']],
+                'not_found': [(phrase, rus, [match(item) for item in items])
+                              for phrase, rus, items in analysis['not_found']],
+                'duplicates': list(analysis['duplicates'].items()),
+                'multiple_matches': [(phrase, [match(item) for item in items])
+                                     for phrase, items in analysis['multiple_matches'].items()],
+                'total_unique_phrases': analysis['total_unique_phrases'],
+                'phrase_order': analysis['phrase_order']
+            }
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._evict()
+        return path
+
+    def _evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.directory, name))
+
+def _to_positions(outcome, positions):
+    """Результат _match_phrase в нумерации полного корпуса."""
+    matches, nearest = outcome
+    return tuple((positions[sub_id], similarity) for sub_id, similarity in matches), \
+        tuple(positions[sub_id] for sub_id in nearest)
+
+def analyze_phrases(subtitles, english_phrases, russian_phrases, threshold, stop_words=None, workers=None,
+                    memo=None, progress=None, matcher=None):
+    """
+    Поиск фраз в субтитрах. subtitles - список субтитров или готовый SubtitleCorpus,
+    который можно переиспользовать между вызовами.
+    workers > 1 включает поиск в пуле процессов; результат совпадает с последовательным.
+    memo (AnalysisMemo) - результаты прошлых проверок: заново ищутся только фразы, которых в нем нет.
+    progress(фраз обработано, всего фраз, просмотрено субтитров, прошло секунд) вызывается по ходу поиска;
+    если он возвращает True, поиск прерывается исключением AnalysisCancelled.
+    matcher - способ сравнения слов (utils.DifflibMatcher и др.); по умолчанию общий из utils.configure_matcher.
+
+    Точные совпадения ищутся сразу для всех фраз (автомат Ахо-Корасик); нечеткий поиск
+    выполняется только для фраз без точных совпадений, поэтому в multiple_matches
+    для таких фраз попадают только точные совпадения.
+    """
     results = {}  # Для хранения множественных совпадений
     phrase_counts = {}  # Для подсчета дублей
     not_found_phrases = []  # Ненайденные фразы
@@ -26,54 +352,70 @@ def analyze_phrases(subtitles, english_phrases, russian_phrases, threshold, stop
     if len(english_phrases) != len(russian_phrases):
         raise ValueError("Количество английских и русских фраз должно совпадать")
 
-    # Исключаем дубли субтитров
-    unique_subtitles = []
-    seen_texts = set()
-    for sub in subtitles:
-        norm_text = normalize_text(sub.text)
-        if norm_text not in seen_texts:
-            seen_texts.add(norm_text)
-            unique_subtitles.append(sub)
+    if stop_words is None:
+        stop_words = set()
 
-    # Поиск совпадений
-    for eng_phrase, rus_phrase in phrase_pairs:
-        if eng_phrase in processed_phrases:
-            continue
+    # Корпус с индексом слов строится один раз на SRT
+    corpus = subtitles if isinstance(subtitles, SubtitleCorpus) else SubtitleCorpus(subtitles)
 
-        norm_phrase = normalize_text(eng_phrase)
-        matches = []
-        seen_texts.clear()
+    # Результаты прошлых проверок (номера субтитров - в нумерации полного корпуса)
+    outcomes = {}
+    scope = AnalysisMemo.scope(corpus, threshold, stop_words) if memo is not None else None
+    if memo is not None:
+        for phrase in phrase_order:
+            outcome = memo.get(scope, phrase)
+            if outcome is not None:
+                outcomes[phrase] = outcome
+    pending_phrases = [phrase for phrase in phrase_order if phrase not in outcomes]
+    tracker = _Progress(progress, len(phrase_order))
+    tracker.advance(len(phrase_order) - len(pending_phrases))
 
-        # Поиск совпадений по всем субтитрам
-        for sub in unique_subtitles:
-            similarity, matched_phrase, matched_text = find_matches(sub.text, eng_phrase, threshold, stop_words)
-            if similarity >= 0.5 and matched_text not in seen_texts:
-                matches.append({
-                    'subtitle': sub,
-                    'similarity': similarity,
-                    'text': sub.text,
-                    'rus_phrase': rus_phrase
-                })
-                seen_texts.add(matched_text)
+    if pending_phrases:
+        lookups = lemma_cache.lookups
+        # Исключаем дубли субтитров
+        with instrumentation.span('дубли субтитров'):
+            unique_corpus = corpus.unique()
+        positions = unique_corpus.positions if unique_corpus is not corpus else range(len(corpus))
+
+        # Точные совпадения для всех фраз за один проход по субтитрам
+        with instrumentation.span('точные совпадения'):
+            found = {phrase: _exact_matches(unique_corpus, sub_ids)
+                     for phrase, sub_ids in unique_corpus.exact_hits(pending_phrases, threshold,
+                                                                           stop_words).items()}
+        tracker.counters['cues'] += len(unique_corpus)
+        tracker.advance(len(found))
 
-        # Сортируем совпадения по убыванию схожести
-        matches.sort(key=lambda x: x['similarity'], reverse=True)
+        # Нечеткий поиск - только для фраз без точных совпадений
+        fuzzy_phrases = [phrase for phrase in pending_phrases if phrase not in found]
+        with instrumentation.span('частичные совпадения'):
+            if workers and workers > 1 and len(fuzzy_phrases) > 1:
+                # Общий способ сравнения задан только в этом процессе, поэтому в пул он передается явно
+                found.update(_match_phrases_parallel(unique_corpus, fuzzy_phrases, threshold, stop_words, workers,
+                                                     tracker, matcher or get_matcher()))
+            else:
+                for phrase in fuzzy_phrases:
+                    found[phrase] = _match_phrase(unique_corpus, phrase, threshold, stop_words, tracker.counters,
+                                                  matcher)
+                    tracker.advance()
 
-        if not matches:
-            # Проверяем пересечение слов длиннее 2 букв
-            def get_valid_words(text):
-                words = re.sub(r'[^\w\s\'-]', ' ', text.lower()).split()
-                return set(w for w in words if len(w) > 2 and w not in stop_words)
+        instrumentation.count('субтитров просмотрено', tracker.counters['cues'])
+        instrumentation.count('пар сравнено', tracker.counters['pairs'])
+        instrumentation.count('лемм запрошено', lemma_cache.lookups - lookups + tracker.counters.get('lemmas', 0))
 
-            phrase_words = get_valid_words(eng_phrase)
-            has_overlap = False
-            for sub in unique_subtitles:
-                sub_words = get_valid_words(sub.text)
-                if phrase_words & sub_words:
-                    has_overlap = True
-                    break
+        for phrase in pending_phrases:
+            outcomes[phrase] = _to_positions(found[phrase], positions)
+            if memo is not None:
+                memo.put(scope, phrase, outcomes[phrase])
 
-            if not has_overlap:
+    # Поиск совпадений
+    for eng_phrase, rus_phrase in phrase_pairs:
+        if eng_phrase in processed_phrases:
+            continue
+
+        phrase_matches, nearest = outcomes[eng_phrase]
+
+        if not phrase_matches:
+            if not nearest:
                 not_found_phrases.append((eng_phrase, rus_phrase, [{
                     'subtitle': None,
                     'similarity': 0.0,
@@ -82,14 +424,12 @@ def analyze_phrases(subtitles, english_phrases, russian_phrases, threshold, stop
                 }]))
                 processed_phrases.add(eng_phrase)
         else:
-            # Удаляем дубли совпадений
-            unique_matches = []
-            seen_texts.clear()
-            for match in matches:
-                norm_text = normalize_text(match['text'])
-                if norm_text not in seen_texts:
-                    seen_texts.add(norm_text)
-                    unique_matches.append(match)
+            unique_matches = [{
+                'subtitle': corpus.subtitles[sub_id],
+                'similarity': similarity,
+                'text': corpus.subtitles[sub_id].text,
+                'rus_phrase': rus_phrase
+            } for sub_id, similarity in phrase_matches]
 
             # Выбираем лучшее совпадение
             best_match = unique_matches[0]
@@ -103,10 +443,17 @@ def analyze_phrases(subtitles, english_phrases, russian_phrases, threshold, stop
             if len(unique_matches) > 1:
                 results[eng_phrase] = unique_matches[:3]
 
-    # Добавляем все нераспределенные фразы в ненайденные
+    # Добавляем все нераспределенные фразы в ненайденные, с ближайшими субтитрами, если они есть
     for eng_phrase, rus_phrase in phrase_pairs:
         if eng_phrase not in processed_phrases:
+            nearest = outcomes[eng_phrase][1]
             not_found_phrases.append((eng_phrase, rus_phrase, [{
+                'subtitle': corpus.subtitles[sub_id],
+                'similarity': 0.0,
+                'text': corpus.subtitles[sub_id].text,
+                'rus_phrase': rus_phrase,
+                'nearest': True
+            } for sub_id in nearest] or [{
                 'subtitle': None,
                 'similarity': 0.0,
                 'text': "нет ни одного совпадающего слова",
@@ -130,34 +477,87 @@ def analyze_phrases(subtitles, english_phrases, russian_phrases, threshold, stop
         'phrase_order': phrase_order
     }
 
-def generate_excerpts(subtitles, phrases, threshold, output_path, selected_matches):
-    with open(output_path, 'w', encoding='utf-8') as f:
-        index = 1
-        sorted_matches = []
-        for phrase, match_list in selected_matches.items():
-            for match in match_list:
-                sorted_matches.append((phrase, match['subtitle'], match['text']))
-        sorted_matches.sort(key=lambda x: x[1].start.ordinal)
+def _write_entries(output_path, entries, tracker):
+    """
+    Запись отрывков SRT (начало, конец, текст) одной операцией записи.
+    Файл открывается только после подготовки всех отрывков, поэтому при отмене он не создается.
+    """
+    with instrumentation.span('запись'):
+        chunks = []
+        for index, (start, end, text) in enumerate(entries, 1):
+            chunks.append(format_srt_entry(index, start, end, text))
+            tracker.advance()
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(chunks))
+
+def generate_excerpts(subtitles, phrases, threshold, output_path, selected_matches, progress=None):
+    """progress - как в analyze_phrases, по числу записанных отрывков."""
+    sorted_matches = []
+    for phrase, match_list in selected_matches.items():
+        for match in match_list:
+            sorted_matches.append((phrase, match['subtitle'], match['text']))
+    sorted_matches.sort(key=lambda x: x[1].start_ms)
+
+    tracker = _Progress(progress, len(sorted_matches))
+    tracker.counters['cues'] = len(sorted_matches)
+    _write_entries(output_path, [(sub.start, sub.end, text) for phrase, sub, text in sorted_matches], tracker)
+
+def export_excerpts(subtitles, selected_items, output_dir, name, phrases=None, threshold=0.5, progress=None):
+    """
+    Запись результатов выбора отрывков: Timestamps_*.srt, english_words_*.txt и russian_words_*.txt.
+    selected_items - список (англ. фраза, рус. фраза, субтитр, текст субтитра).
+    Возвращает пути к записанным файлам.
+    """
+    selected = {}
+    selected_phrases_with_time = []
+    for phrase, rus_phrase, sub, text in selected_items:
+        if phrase not in selected:
+            selected[phrase] = []
+        selected[phrase].append({'subtitle': sub, 'text': text})
+        selected_phrases_with_time.append((sub.start_ms, phrase, rus_phrase, sub))
+
+    selected_phrases_with_time.sort(key=lambda x: x[0])
+    selected_eng_phrases = [item[1] for item in selected_phrases_with_time]
+    selected_rus_phrases = [item[2] for item in selected_phrases_with_time]
+
+    filename = f"{name}_sub-{len(selected_eng_phrases)}"
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    output_path = os.path.join(output_dir, f"Timestamps_{filename}.srt")
+    generate_excerpts(subtitles, phrases or selected_eng_phrases, threshold, output_path, selected, progress)
 
-        for phrase, sub, text in sorted_matches:
-            f.write(format_srt_entry(index, sub.start, sub.end, text))
-            index += 1
+    with instrumentation.span('запись'):
+        rus_words_file = os.path.join(output_dir, f"russian_words_{filename}.txt")
+        with open(rus_words_file, 'w', encoding='utf-8') as f_rus:
+            for rus_phrase in selected_rus_phrases:
+                f_rus.write(f"{rus_phrase}\n")
 
-def generate_timestamps(subtitles, phrases, threshold, output_path, selected_matches):
+        eng_words_file = os.path.join(output_dir, f"english_words_{filename}.txt")
+        with open(eng_words_file, 'w', encoding='utf-8') as f_eng:
+            for eng_phrase in selected_eng_phrases:
+                f_eng.write(f"{eng_phrase}\n")
+
+    return output_path, eng_words_file, rus_words_file
+
+def generate_timestamps(subtitles, phrases, threshold, output_path, selected_matches, progress=None):
+    """progress - как в analyze_phrases: по числу обработанных отрывков (расчет таймкодов и запись)."""
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            index = 1
-            sorted_matches = []
-            for phrase, match_list in selected_matches.items():
-                for match in match_list:
-                    subtitle = match['subtitle']
-                    start, end = calculate_exact_timestamps(subtitle, phrase)
-                    sorted_matches.append((phrase, start, end, phrase))
-            sorted_matches.sort(key=lambda x: x[1].ordinal)
-
-            for phrase, start, end, text in sorted_matches:
-                f.write(format_srt_entry(index, start, end, text))
-                index += 1
+        # Подготовленные тексты берутся из корпуса, если он передан вместо списка субтитров
+        corpus = subtitles if isinstance(subtitles, SubtitleCorpus) else None
+        pairs = [(match['subtitle'], phrase) for phrase, match_list in selected_matches.items()
+                 for match in match_list]
+        tracker = _Progress(progress, 2 * len(pairs))
+        # Все пары (субтитр, фраза) обрабатываются одним пакетом
+        with instrumentation.span('таймкоды'):
+            timestamps = calculate_timestamps_batch(pairs, corpus)
+        tracker.counters['cues'] += len(pairs)
+        tracker.advance(len(pairs))
+        sorted_matches = [(phrase, start, end, phrase) for (subtitle, phrase), (start, end) in zip(pairs, timestamps)]
+        sorted_matches.sort(key=lambda x: x[1].ordinal)
+
+        _write_entries(output_path, [(start, end, text) for phrase, start, end, text in sorted_matches], tracker)
+    except AnalysisCancelled:
+        raise
     except Exception as e:
         print(f"Error writing timestamps file: {e}")
-        raise
\ No newline at end of file
+        raise
@@ -1,101 +1,1694 @@
-import pysrt
-import pymorphy3
 import re
+import os
+import json
+import mmap
+import time
+import codecs
+import cProfile
+import struct
+import zlib
+import hashlib
+import threading
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from difflib import SequenceMatcher
 
-# Инициализация моделей
-morph = pymorphy3.MorphAnalyzer()
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: без него используется SequenceMatcher
+    np = None
 
-def find_matches(subtitle_text, phrase, threshold=0.5, stop_words=None, whitelist=None):
+# Морфологический анализатор создается лениво: загрузка словарей занимает заметное время
+_morph = None
+_morph_lock = threading.Lock()
+_morph_ready = threading.Event()
+
+def get_morph():
+    """
+    Общий pymorphy3.MorphAnalyzer; создается при первом обращении.
+    Если идет фоновый прогрев, вызов дождется его окончания.
+    """
+    global _morph
+    if _morph is None:
+        with _morph_lock:
+            if _morph is None:
+                import pymorphy3
+                _morph = pymorphy3.MorphAnalyzer()
+                _morph_ready.set()
+    return _morph
+
+def warm_up_morph():
+    """Загрузка словарей в фоновом потоке (например, пока строится окно)."""
+    thread = threading.Thread(target=get_morph, name="morph-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def is_morph_ready():
+    return _morph_ready.is_set()
+
+# Переменная окружения с папкой для дампов cProfile (файлы .pstats, смотреть через pstats или snakeviz)
+PROFILE_ENV = 'SUBTITLE_PROFILE'
+
+class Instrumentation:
+    """
+    Время этапов обработки и счетчики операции: этапы суммируются по имени
+    (время и число вызовов), счетчики - просто складываются.
+    """
+
+    def __init__(self):
+        self.spans = OrderedDict()  # Имя этапа -> [секунд, вызовов]
+        self.counters = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - start)
+
+    def add_span(self, name, seconds, calls=1):
+        with self._lock:
+            span = self.spans.setdefault(name, [0.0, 0])
+            span[0] += seconds
+            span[1] += calls
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return {'spans': {name: tuple(span) for name, span in self.spans.items()},
+                    'counters': dict(self.counters)}
+
+    def merge(self, snapshot):
+        """Добавление замеров из другого процесса (результат snapshot())."""
+        for name, (seconds, calls) in snapshot['spans'].items():
+            self.add_span(name, seconds, calls)
+        for name, value in snapshot['counters'].items():
+            self.count(name, value)
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+
+    def summary(self):
+        """Замеры в виде строк "этап: секунд (вызовов)" и "счетчик: значение"."""
+        snapshot = self.snapshot()
+        lines = [f"{name}: {seconds:.3f} с ({calls})" for name, (seconds, calls) in snapshot['spans'].items()]
+        lines.extend(f"{name}: {value}" for name, value in snapshot['counters'].items())
+        return "\n".join(lines)
+
+instrumentation = Instrumentation()
+
+@contextmanager
+def profiled(name):
+    """
+    Профилирование блока cProfile, если задана переменная окружения SUBTITLE_PROFILE:
+    дамп pstats записывается в указанную ей папку как <name>_<дата>.pstats.
+    cProfile видит только текущий поток.
+    """
+    directory = os.environ.get(PROFILE_ENV)
+    if not directory:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(directory, f"{name}_{datetime.now():%Y%m%d_%H%M%S_%f}.pstats"))
+
+_CLEAN_EXACT_RE = re.compile(r'[^\w\s\'-]')
+# Разделитель текстов в общем индексе: после очистки он не может встретиться ни в субтитре, ни во фразе
+_INDEX_SEPARATOR = '\x00'
+
+def clean_text_exact(text):
+    """Очистка текста для точного совпадения: нижний регистр, пунктуация заменяется пробелами."""
+    if not text or not isinstance(text, str):
+        return ""
+    return _CLEAN_EXACT_RE.sub(' ', text.lower()).strip()
+
+class CompiledText:
+    """
+    Текст, подготовленный к сравнению один раз: очищенная строка, список и множество слов.
+    Лемматизированная форма и начала ее слов вычисляются при первом обращении.
+    """
+
+    __slots__ = ('text', 'clean', 'words', 'word_set', '_lemma', '_lemma_offsets')
+
+    def __init__(self, text, lemma=None):
+        self.text = text
+        self.clean = clean_text_exact(text)
+        self.words = self.clean.split()
+        self.word_set = set(self.words)
+        self._lemma = lemma  # Можно передать готовую (например, сохраненную в индексе сезона)
+        self._lemma_offsets = None
+
+    @classmethod
+    def prepared(cls, text, clean, words, lemma=None):
+        """Текст с уже вычисленными очищенной строкой и словами (например, из .sidx) - без регулярных выражений."""
+        compiled = cls.__new__(cls)
+        compiled.text = text
+        compiled.clean = clean
+        compiled.words = words
+        compiled.word_set = set(words)
+        compiled._lemma = lemma
+        compiled._lemma_offsets = None
+        return compiled
+
+    @property
+    def lemma(self):
+        if self._lemma is None:
+            self._lemma = normalize_text(self.text)
+        return self._lemma
+
+    @property
+    def lemma_offsets(self):
+        """Позиции начала слов в лемматизированной строке (по возрастанию)."""
+        if self._lemma_offsets is None:
+            self._lemma_offsets = array('l', (match.start() for match in re.finditer(r'\S+', self.lemma)))
+        return self._lemma_offsets
+
+    def find_lemma_words(self, phrase):
+        """
+        Номер первого слова, с которого в лемматизированной строке идут слова фразы
+        (по подготовленным началам слов, без перебора окон); None, если таких нет.
+        """
+        norm_phrase = phrase.lemma
+        if not norm_phrase:
+            return 0 if self.lemma_offsets else None
+        lemma = self.lemma
+        end_gap = len(norm_phrase)
+        pos = lemma.find(norm_phrase)
+        while pos != -1:
+            end = pos + end_gap
+            if (pos == 0 or lemma[pos - 1] == ' ') and (end == len(lemma) or lemma[end] == ' '):
+                return bisect_left(self.lemma_offsets, pos)
+            pos = lemma.find(norm_phrase, pos + 1)
+        return None
+
+class CompiledPhrase(CompiledText):
+    """Фраза-запрос: к подготовленному тексту добавляется расчет отбора кандидатов."""
+
+    __slots__ = ()
+
+    def min_run(self, threshold):
+        """Минимальная длина общего отрезка слов, которую пропустит find_matches."""
+        threshold = max(threshold, 0.5)
+        return next((size for size in range(1, len(self.words) + 1)
+                     if size / len(self.words) >= threshold), len(self.words) + 1)
+
+    def index_words(self, threshold, stop_words):
+        """
+        Слова фразы для поиска в индексе. Стоп-слова можно пропустить, только если
+        любой отрезок длины min_run содержит обычное слово.
+        """
+        min_run = self.min_run(threshold)
+        run = 0
+        for word in self.words:
+            run = run + 1 if word in stop_words else 0
+            if run >= min_run:
+                return self.word_set
+        return self.word_set - set(stop_words)
+
+def compile_text(value):
+    return value if isinstance(value, CompiledText) else CompiledText(value)
+
+def compile_phrase(value):
+    return value if isinstance(value, CompiledPhrase) else CompiledPhrase(value)
+
+class SubtitleCorpus:
+    """
+    Субтитры SRT-файла, подготовленные к поиску один раз при загрузке:
+    очищенный текст, слова и инвертированный индекс слово -> номера субтитров.
+    Фраза сравнивается только с субтитрами, у которых есть общее слово,
+    что не меняет результатов find_matches для порогов >= 0.5.
+    """
+
+    def __init__(self, subtitles, texts=None, index=None):
+        self.subtitles = list(subtitles)
+        self.entries = []
+        # Готовый индекс слов (например, из .sidx) должен быть построен по тем же субтитрам
+        self.index = {} if index is None else index
+        # Общий для корпуса кэш подготовленных текстов: одинаковые тексты готовятся один раз
+        self._by_text = {} if texts is None else texts
+        for sub_id, sub in enumerate(self.subtitles):
+            entry = self._by_text.get(sub.text)
+            if entry is None:
+                entry = self._by_text[sub.text] = CompiledText(sub.text)
+            self.entries.append(entry)
+            if index is None:
+                for word in entry.word_set:
+                    self.index.setdefault(word, []).append(sub_id)
+
+        # Все очищенные тексты в одной строке - для поиска точных (подстрочных) совпадений
+        self._joined = _INDEX_SEPARATOR.join(entry.clean for entry in self.entries)
+        self._offsets = []
+        offset = 0
+        for entry in self.entries:
+            self._offsets.append(offset)
+            offset += len(entry.clean) + len(_INDEX_SEPARATOR)
+        self._unique = None
+        self._run_scorer = None
+        self._token_ids = None
+        self._fingerprint = None
+        # Для корпуса без дублей: номер субтитра -> номер в исходном корпусе
+        self.positions = list(range(len(self.subtitles)))
+
+    def __len__(self):
+        return len(self.subtitles)
+
+    def __getstate__(self):
+        # Номера слов из .sidx - memoryview поверх mmap; в другом процессе они строятся заново
+        state = self.__dict__.copy()
+        state['_token_ids'] = None
+        return state
+
+    def fingerprint(self):
+        """Хэш текстов субтитров (по порядку): результаты поиска зависят только от них, а не от таймкодов."""
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            for entry in self.entries:
+                digest.update(entry.text.encode('utf-8'))
+                digest.update(b'\x00')
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def run_scorer(self):
+        """Векторизованный RunScorer по словам корпуса (строится при первом обращении); None без NumPy."""
+        if self._run_scorer is None and np is not None:
+            self._run_scorer = RunScorer([entry.words for entry in self.entries])
+        return self._run_scorer
+
+    def token_ids(self):
+        """Общий словарь слово -> номер и номера слов каждого субтитра (строятся при первом обращении)."""
+        if self._token_ids is None:
+            vocabulary = {}
+            ids = [array('l', [vocabulary.setdefault(word, len(vocabulary)) for word in entry.words])
+                   for entry in self.entries]
+            self._token_ids = (vocabulary, ids)
+        return self._token_ids
+
+    def lookup(self, text):
+        """Подготовленный текст субтитра; для текстов вне корпуса готовится на месте."""
+        entry = self._by_text.get(text)
+        if entry is None:
+            entry = self._by_text[text] = CompiledText(text)
+        return entry
+
+    def unique(self):
+        """Корпус без дублей: субтитры с одинаковым лемматизированным текстом берутся один раз."""
+        if self._unique is None:
+            unique_subtitles = []
+            positions = []
+            seen_texts = set()
+            for position, (sub, entry) in enumerate(zip(self.subtitles, self.entries)):
+                if entry.lemma not in seen_texts:
+                    seen_texts.add(entry.lemma)
+                    unique_subtitles.append(sub)
+                    positions.append(position)
+            self._unique = SubtitleCorpus(unique_subtitles, texts=self._by_text)
+            self._unique._unique = self._unique
+            self._unique.positions = positions
+            if self._token_ids is not None:
+                vocabulary, ids = self._token_ids
+                self._unique._token_ids = (vocabulary, [ids[position] for position in positions])
+        return self._unique
+
+    def exact_candidates(self, norm_phrase):
+        """Номера субтитров, в очищенном тексте которых фраза встречается как подстрока."""
+        found = set()
+        pos = self._joined.find(norm_phrase)
+        while pos != -1:
+            sub_id = bisect_right(self._offsets, pos) - 1
+            found.add(sub_id)
+            if sub_id + 1 >= len(self._offsets):
+                break
+            pos = self._joined.find(norm_phrase, self._offsets[sub_id + 1])
+        return found
+
+    def exact_hits(self, phrases, threshold=0.5, stop_words=None):
+        """
+        Точные совпадения (схожесть 1.0) сразу для всех фраз за один проход по субтитрам.
+        Совпадением, как и в _match_phrase, считается очищенная фраза внутри очищенного текста
+        или слова фразы, идущие подряд среди слов субтитра-кандидата. Для каждого вида
+        фразы собираются в свой автомат Ахо-Корасик.
+        Возвращает {фраза: номера субтитров по возрастанию} только для фраз с совпадениями.
+        """
+        compiled = [compile_phrase(phrase) for phrase in phrases]
+        hits = {}
+        patterns = []
+        for phrase in compiled:
+            if not phrase.clean:
+                # Пустая после очистки фраза - подстрока любого текста
+                hits[phrase.text] = list(range(len(self.subtitles)))
+            else:
+                patterns.append(phrase)
+        if not patterns:
+            return hits
+
+        # Слова подряд ищутся в строке слов через пробел, с пробелами по краям - только целые слова.
+        # Фразы без слов для индекса не дают кандидатов, кроме точных, поэтому ищутся только целиком
+        stop_words = stop_words or ()
+        word_patterns = {phrase.text: ' %s ' % ' '.join(phrase.words) for phrase in patterns
+                         if phrase.index_words(threshold, stop_words)}
+        automaton = AhoCorasick(phrase.clean for phrase in patterns)
+        word_automaton = AhoCorasick(word_patterns.values())
+        found = [set() for _ in range(len(patterns))]
+        word_found = [set() for _ in range(len(word_patterns))]
+        for sub_id, entry in enumerate(self.entries):
+            for pattern_id in automaton.search(entry.clean):
+                found[pattern_id].add(sub_id)
+            if word_patterns:
+                for pattern_id in word_automaton.search(' %s ' % ' '.join(entry.words)):
+                    word_found[pattern_id].add(sub_id)
+        for phrase in patterns:
+            sub_ids = found[automaton.pattern_ids[phrase.clean]]
+            if phrase.text in word_patterns:
+                sub_ids = sub_ids | word_found[word_automaton.pattern_ids[word_patterns[phrase.text]]]
+            if sub_ids:
+                hits[phrase.text] = sorted(sub_ids)
+        return hits
+
+    def overlapping_cues(self, phrase, stop_words=None, limit=None):
+        """
+        Субтитры, у которых есть общее с фразой слово длиннее 2 букв (не стоп-слово),
+        по убыванию числа общих слов. Использует тот же индекс слов, поэтому стоит
+        одного обращения к словарю на слово фразы.
+        """
+        phrase = compile_phrase(phrase)
+        stop_words = stop_words or ()
+        shared = {}
+        for word in phrase.word_set:
+            if len(word) > 2 and word not in stop_words:
+                for sub_id in self.index.get(word, ()):
+                    shared[sub_id] = shared.get(sub_id, 0) + 1
+        ranked = sorted(shared, key=lambda sub_id: (-shared[sub_id], sub_id))
+        return ranked[:limit] if limit is not None else ranked
+
+    def candidates(self, phrase, threshold=0.5, stop_words=None):
+        """
+        Номера субтитров (по возрастанию), которые могут дать совпадение с фразой.
+        Остальные субтитры find_matches гарантированно отклонит.
+        """
+        phrase = compile_phrase(phrase)
+        if not phrase.words:
+            return list(range(len(self.subtitles)))
+
+        found = self.exact_candidates(phrase.clean)
+        for word in phrase.index_words(threshold, stop_words or ()):
+            found.update(self.index.get(word, ()))
+        return sorted(found)
+
+class AhoCorasick:
+    """
+    Автомат Ахо-Корасик для поиска многих строк за один проход по тексту.
+    Шаблоны нумеруются в порядке добавления; одинаковые шаблоны получают общий номер первого.
+    """
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [()]
+        self.pattern_ids = {}
+        for pattern_id, pattern in enumerate(patterns):
+            if pattern in self.pattern_ids:
+                continue
+            self.pattern_ids[pattern] = pattern_id
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append(())
+                state = next_state
+            self.outputs[state] = (pattern_id,)
+        self._build_links()
+
+    def _build_links(self):
+        # Обход в ширину: ссылка неудачи и выходы состояния наследуются от более короткого суффикса
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                if self.outputs[self.fail[next_state]]:
+                    self.outputs[next_state] += self.outputs[self.fail[next_state]]
+
+    def search(self, text):
+        """Номера шаблонов, встречающихся в тексте (каждый один раз)."""
+        found = set()
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+class RunScorer:
+    """
+    Длина наибольшего общего отрезка слов фразы с каждым субтитром за один проход NumPy.
+    Слова заменяются номерами из общего словаря, субтитры упакованы в матрицу с заполнением нулями.
+    Дает те же длины, что SequenceMatcher.find_longest_match в find_matches.
+    """
+
+    # Для таких длинных фраз SequenceMatcher включает autojunk и результаты могут отличаться
+    MAX_PHRASE_WORDS = 199
+
+    def __init__(self, word_lists):
+        self.vocabulary = {}
+        width = max((len(words) for words in word_lists), default=0)
+        self.matrix = np.zeros((len(word_lists), max(width, 1)), dtype=np.int32)
+        for row, words in enumerate(word_lists):
+            if words:
+                self.matrix[row, :len(words)] = [self.vocabulary.setdefault(word, len(self.vocabulary) + 1)
+                                                 for word in words]
+
+    def longest_runs(self, words, rows=None):
+        """Массив длин наибольшего общего отрезка для строк rows (по умолчанию - для всех субтитров)."""
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        best = np.zeros(len(matrix), dtype=np.int32)
+        prev = None
+        for word in words:
+            # Слова вне словаря получают -1 и не совпадают ни с чем, включая заполнение
+            equal = matrix == self.vocabulary.get(word, -1)
+            run = equal.astype(np.int32)
+            if prev is not None:
+                # run[i][j] = run[i-1][j-1] + 1 там, где слова совпадают
+                run[:, 1:] += prev[:, :-1] * equal[:, 1:]
+            np.maximum(best, run.max(axis=1), out=best)
+            prev = run
+        return best
+
+class DifflibMatcher:
+    """
+    Эталонный способ сравнения слов субтитра и фразы: наибольший общий отрезок
+    (SequenceMatcher.find_longest_match) и наибольшая общая подпоследовательность (LCS).
+    Остальные способы должны давать те же результаты (проверка: python -m benchmarks.parity).
+    """
+
+    name = 'difflib'
+
+    def longest_match(self, a, b):
+        """Наибольший общий отрезок списков слов a и b: (начало в a, начало в b, длина)."""
+        match = SequenceMatcher(None, a, b).find_longest_match(0, len(a), 0, len(b))
+        return match.a, match.b, match.size
+
+    def longest_runs(self, corpus, phrase, sub_ids):
+        """Длины наибольшего общего отрезка слов фразы (CompiledPhrase) с субтитрами sub_ids корпуса."""
+        return [self.longest_match(corpus.entries[sub_id].words, phrase.words)[2] for sub_id in sub_ids]
+
+    def lcs_length(self, a, b):
+        """Длина наибольшей общей подпоследовательности списков слов a и b."""
+        row = [0] * (len(b) + 1)
+        for word in a:
+            prev = 0
+            for j, other in enumerate(b):
+                prev, row[j + 1] = row[j + 1], prev + 1 if word == other else max(row[j + 1], row[j])
+        return row[-1]
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+class BitParallelMatcher(DifflibMatcher):
+    """
+    Битово-параллельное сравнение по номерам слов: для фразы один раз строятся маски
+    слово -> биты позиций во фразе (бит j - слово фразы номер j). Маски слов субтитра
+    упаковываются в одно целое число (по слоту на слово), и каждый шаг поиска наибольшего
+    общего отрезка - один сдвиг и одно "и" сразу для всех слов: после L шагов бит j слота i
+    остается, если отрезок длины L заканчивается на слове i субтитра и слове j фразы.
+    LCS считается алгоритмом Аллисона-Дикс/Хюрё. Для фраз длиннее MAX_PHRASE_WORDS слов
+    SequenceMatcher включает autojunk, поэтому для них используется эталон.
+    """
+
+    name = 'bitparallel'
+    MAX_PHRASE_WORDS = 199
+
+    @staticmethod
+    def masks(words):
+        masks = {}
+        for j, word in enumerate(words):
+            masks[word] = masks.get(word, 0) | (1 << j)
+        return masks
+
+    @staticmethod
+    def _slot_bytes(phrase_len):
+        # В слоте нужен свободный старший бит: в него уходит перенос сдвига из предыдущего слота
+        return phrase_len // 8 + 1
+
+    def longest_match(self, a, b, masks=None):
+        if len(b) > self.MAX_PHRASE_WORDS:
+            return super().longest_match(a, b)
+        masks = masks if masks is not None else self.masks(b)
+        width = self._slot_bytes(len(b))
+        packed = int.from_bytes(b''.join(masks.get(word, 0).to_bytes(width, 'little') for word in a), 'little')
+        shift = 8 * width + 1
+        size = 0
+        level = packed
+        while level:
+            size += 1
+            last = level
+            level = (level << shift) & packed
+        if not size:
+            return 0, 0, 0
+        # Как в SequenceMatcher: самый ранний в a, при равенстве - самый ранний в b
+        end, j = divmod((last & -last).bit_length() - 1, 8 * width)
+        return end - size + 1, j - size + 1, size
+
+    def longest_runs(self, corpus, phrase, sub_ids):
+        if len(phrase.words) > self.MAX_PHRASE_WORDS:
+            return super().longest_runs(corpus, phrase, sub_ids)
+        vocabulary, token_ids = corpus.token_ids()
+        width = self._slot_bytes(len(phrase.words))
+        # Упакованная маска для каждого номера слова корпуса: слова не из фразы дают нулевой слот
+        table = [bytes(width)] * len(vocabulary)
+        for word, mask in self.masks(phrase.words).items():
+            token = vocabulary.get(word)
+            if token is not None:
+                table[token] = mask.to_bytes(width, 'little')
+        shift = 8 * width + 1
+        runs = []
+        for sub_id in sub_ids:
+            packed = int.from_bytes(b''.join(map(table.__getitem__, token_ids[sub_id])), 'little')
+            size = 0
+            level = packed
+            while level:
+                size += 1
+                level = (level << shift) & packed
+            runs.append(size)
+        return runs
+
+    def lcs_length(self, a, b):
+        masks = self.masks(b)
+        full = (1 << len(b)) - 1
+        row = full
+        for word in a:
+            matched = row & masks.get(word, 0)
+            row = ((row + matched) | (row - matched)) & full
+        return len(b) - bin(row).count('1')
+
+class NumpyMatcher(BitParallelMatcher):
+    """Отрезки фразы со всеми кандидатами корпуса - одним проходом NumPy (RunScorer), отдельные пары - битово."""
+
+    name = 'numpy'
+
+    def longest_runs(self, corpus, phrase, sub_ids):
+        scorer = corpus.run_scorer()
+        if scorer is None or not sub_ids or len(phrase.words) > scorer.MAX_PHRASE_WORDS:
+            return super().longest_runs(corpus, phrase, sub_ids)
+        return scorer.longest_runs(phrase.words, sub_ids).tolist()
+
+MATCHERS = {matcher.name: matcher for matcher in (DifflibMatcher, BitParallelMatcher, NumpyMatcher)}
+
+_matcher = None
+
+def create_matcher(name='auto'):
+    """Способ сравнения по имени из config.ini; auto - NumPy, если он установлен, иначе битовый."""
+    if name == 'auto':
+        name = NumpyMatcher.name if np is not None else BitParallelMatcher.name
+    if name == NumpyMatcher.name and np is None:
+        raise ValueError("Для способа сравнения numpy нужен установленный NumPy")
+    if name not in MATCHERS:
+        raise ValueError(f"Неизвестный способ сравнения: {name} (доступны: auto, {', '.join(MATCHERS)})")
+    return MATCHERS[name]()
+
+def get_matcher():
+    """Общий способ сравнения для find_matches и analyze_phrases (по умолчанию - auto)."""
+    global _matcher
+    if _matcher is None:
+        _matcher = create_matcher()
+    return _matcher
+
+def configure_matcher(name='auto'):
+    """Выбор общего способа сравнения (из config.ini)."""
+    global _matcher
+    _matcher = create_matcher(name)
+    return _matcher
+
+def find_matches(subtitle_text, phrase, threshold=0.5, stop_words=None, whitelist=None, matcher=None):
     """
     Поиск совпадений между фразой и субтитром с использованием точного и частичного совпадения.
+    Принимает строки или заранее подготовленные CompiledText/CompiledPhrase.
+    matcher - способ сравнения слов (по умолчанию общий, см. configure_matcher).
     """
     if stop_words is None:
         stop_words = set()
     if whitelist is None:
         whitelist = set(["not", "yes", "out", "i", "im", "is", "are", "a", "an", "the"])
 
-    # Очистка текста для точного совпадения
-    def clean_text_exact(text):
-        if not text or not isinstance(text, str):
-            return ""
-        text = re.sub(r'[^\w\s\'-]', ' ', text.lower()).strip()
-        return text
+    subtitle = compile_text(subtitle_text)
+    phrase = compile_phrase(phrase)
 
     # Точное совпадение
-    norm_subtitle_exact = clean_text_exact(subtitle_text)
-    norm_phrase_exact = clean_text_exact(phrase)
-    if norm_phrase_exact in norm_subtitle_exact:
-        return 1.0, norm_phrase_exact, subtitle_text
-
-    # Частичное совпадение с SequenceMatcher
-    norm_subtitle_clean = clean_text_exact(subtitle_text)
-    norm_phrase_clean = clean_text_exact(phrase)
-    matcher = SequenceMatcher(None, norm_subtitle_clean.split(), norm_phrase_clean.split())
-    match = matcher.find_longest_match(0, len(norm_subtitle_clean.split()), 0, len(norm_phrase_clean.split()))
-    if match.size > 0:
-        partial_similarity = match.size / len(norm_phrase_clean.split()) if norm_phrase_clean.split() else 0.0
+    if phrase.clean in subtitle.clean:
+        return 1.0, phrase.clean, subtitle.text
+
+    # Частичное совпадение: наибольший общий отрезок слов
+    sub_words = subtitle.words
+    phrase_words = phrase.words
+    start_idx, _, size = (matcher or get_matcher()).longest_match(sub_words, phrase_words)
+    if size > 0:
+        partial_similarity = size / len(phrase_words) if phrase_words else 0.0
         if partial_similarity >= threshold:
-            start_idx = match.a
-            end_idx = match.a + match.size
-            matched_text = " ".join(norm_subtitle_clean.split()[start_idx:end_idx])
-            return partial_similarity, matched_text, subtitle_text
+            end_idx = start_idx + size
+            matched_text = " ".join(sub_words[start_idx:end_idx])
+            return partial_similarity, matched_text, subtitle.text
 
     return 0.0, None, None
 
 # Оставшиеся функции остаются без изменений
+class SrtTime:
+    """Легкая замена pysrt.SubRipTime: время в миллисекундах (ordinal) и его части."""
+
+    __slots__ = ('ordinal',)
+
+    def __init__(self, hours=0, minutes=0, seconds=0, milliseconds=0):
+        self.ordinal = hours * 3600000 + minutes * 60000 + seconds * 1000 + milliseconds
+
+    @classmethod
+    def from_ordinal(cls, ordinal):
+        time = cls.__new__(cls)
+        time.ordinal = int(ordinal)
+        return time
+
+    @classmethod
+    def from_string(cls, source):
+        """HH:MM:SS,mmm (разделители ':', '.' или ',') -> SrtTime; ValueError при неверном формате."""
+        items = _SRT_TIME_SEP_RE.split(source)
+        if len(items) != 4:
+            raise ValueError(f"Неверный формат времени: {source!r}")
+        return cls(*(_parse_time_int(item) for item in items))
+
+    @property
+    def hours(self):
+        return self.ordinal // 3600000
+
+    @property
+    def minutes(self):
+        return self.ordinal % 3600000 // 60000
+
+    @property
+    def seconds(self):
+        return self.ordinal % 60000 // 1000
+
+    @property
+    def milliseconds(self):
+        return self.ordinal % 1000
+
+    def __add__(self, other):
+        return SrtTime.from_ordinal(self.ordinal + _ordinal(other))
+
+    def __sub__(self, other):
+        return SrtTime.from_ordinal(self.ordinal - _ordinal(other))
+
+    def __eq__(self, other):
+        return isinstance(other, (SrtTime, int)) and self.ordinal == _ordinal(other)
+
+    def __lt__(self, other):
+        return self.ordinal < _ordinal(other)
+
+    def __le__(self, other):
+        return self.ordinal <= _ordinal(other)
+
+    def __gt__(self, other):
+        return self.ordinal > _ordinal(other)
+
+    def __ge__(self, other):
+        return self.ordinal >= _ordinal(other)
+
+    def __hash__(self):
+        return hash(self.ordinal)
+
+    def __str__(self):
+        ordinal = max(self.ordinal, 0)
+        return "%02d:%02d:%02d,%03d" % (ordinal // 3600000, ordinal % 3600000 // 60000,
+                                        ordinal % 60000 // 1000, ordinal % 1000)
+
+    def __repr__(self):
+        return f"SrtTime({self.hours}, {self.minutes}, {self.seconds}, {self.milliseconds})"
+
+    def __getstate__(self):
+        return self.ordinal
+
+    def __setstate__(self, state):
+        self.ordinal = state
+
+def _ordinal(value):
+    return value.ordinal if isinstance(value, SrtTime) else int(value)
+
+_SRT_TIME_SEP_RE = re.compile(r'\:|\.|\,')
+_SRT_INTEGER_RE = re.compile(r'^(\d+)')
+
+def _parse_time_int(digits):
+    try:
+        return int(digits)
+    except ValueError:
+        match = _SRT_INTEGER_RE.match(digits)
+        return int(match.group()) if match else 0
+
+class Cue:
+    """Легкая запись субтитра: номер, время начала и конца, текст (совместима с pysrt.SubRipItem)."""
+
+    __slots__ = ('index', 'start', 'end', 'text', 'position')
+
+    def __init__(self, index, start, end, text, position=''):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.text = text
+        self.position = position
+
+    @property
+    def start_ms(self):
+        return self.start.ordinal
+
+    @property
+    def end_ms(self):
+        return self.end.ordinal
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return f"Cue({self.index!r}, {self.start}, {self.end}, {self.text!r})"
+
+    def __getstate__(self):
+        return self.index, self.start.ordinal, self.end.ordinal, self.text, self.position
+
+    def __setstate__(self, state):
+        index, start, end, self.text, self.position = state
+        self.index = index
+        self.start = SrtTime.from_ordinal(start)
+        self.end = SrtTime.from_ordinal(end)
+
+class CueStore:
+    """
+    Компактное хранилище субтитров: время начала и конца (мс) - в массивах array('l'),
+    тексты и номера - в списках. Сортировка и сдвиг времени работают прямо с массивами;
+    для совместимости элементы отдаются как легкие представления CueView.
+    """
+
+    def __init__(self, cues=()):
+        self.starts = array('l')
+        self.ends = array('l')
+        self.texts = []
+        self.indexes = []
+        self._order = None  # Номера субтитров по возрастанию времени начала
+        for cue in cues:
+            self.append(cue.index, cue.start.ordinal, cue.end.ordinal, cue.text)
+
+    def append(self, index, start_ms, end_ms, text):
+        self.starts.append(start_ms)
+        self.ends.append(end_ms)
+        self.texts.append(text)
+        self.indexes.append(index)
+        self._order = None
+        return len(self.texts) - 1
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __iter__(self):
+        return (CueView(self, cue_id) for cue_id in range(len(self.texts)))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [CueView(self, cue_id) for cue_id in range(len(self.texts))[key]]
+        if key < 0:
+            key += len(self.texts)
+        if not 0 <= key < len(self.texts):
+            raise IndexError("CueStore index out of range")
+        return CueView(self, key)
+
+    def _invalidate(self):
+        self._order = None
+
+    def sorted_ids(self):
+        """Номера субтитров по возрастанию времени начала (порядок кэшируется до изменения времени)."""
+        if self._order is None:
+            starts = self.starts
+            self._order = sorted(range(len(starts)), key=starts.__getitem__)
+        return self._order
+
+    def sorted_by_time(self):
+        return [CueView(self, cue_id) for cue_id in self.sorted_ids()]
+
+    def set_times(self, cue_id, start_ms, end_ms):
+        self.starts[cue_id] = start_ms
+        self.ends[cue_id] = end_ms
+        self._invalidate()
+
+    def shift(self, cue_ids, start_delta_ms, end_delta_ms):
+        """Сдвиг начала и конца субтитров; начало не меньше 0, конец позже начала."""
+        starts, ends = self.starts, self.ends
+        for cue_id in cue_ids:
+            start_ms = max(0, starts[cue_id] + start_delta_ms)
+            starts[cue_id] = start_ms
+            ends[cue_id] = max(start_ms + 1, ends[cue_id] + end_delta_ms)
+        self._invalidate()
+
+class CueView:
+    """Представление одного субтитра из CueStore с интерфейсом Cue; изменения пишутся в хранилище."""
+
+    __slots__ = ('store', 'id')
+
+    def __init__(self, store, cue_id):
+        self.store = store
+        self.id = cue_id
+
+    @property
+    def index(self):
+        return self.store.indexes[self.id]
+
+    @index.setter
+    def index(self, value):
+        self.store.indexes[self.id] = value
+
+    @property
+    def text(self):
+        return self.store.texts[self.id]
+
+    @text.setter
+    def text(self, value):
+        self.store.texts[self.id] = value
+
+    @property
+    def start_ms(self):
+        return self.store.starts[self.id]
+
+    @property
+    def end_ms(self):
+        return self.store.ends[self.id]
+
+    @property
+    def start(self):
+        return SrtTime.from_ordinal(self.store.starts[self.id])
+
+    @start.setter
+    def start(self, value):
+        self.store.set_times(self.id, _ordinal(value), self.store.ends[self.id])
+
+    @property
+    def end(self):
+        return SrtTime.from_ordinal(self.store.ends[self.id])
+
+    @end.setter
+    def end(self, value):
+        self.store.set_times(self.id, self.store.starts[self.id], _ordinal(value))
+
+    @property
+    def duration(self):
+        return SrtTime.from_ordinal(self.end_ms - self.start_ms)
+
+    def __eq__(self, other):
+        return isinstance(other, CueView) and other.store is self.store and other.id == self.id
+
+    def __hash__(self):
+        return hash((id(self.store), self.id))
+
+    def __repr__(self):
+        return f"CueView({self.index!r}, {self.start}, {self.end}, {self.text!r})"
+
+# Как в pysrt: кодировка определяется по BOM, иначе utf-8
+_SRT_BOMS = ((codecs.BOM_UTF32_LE, 'utf_32_le'),
+             (codecs.BOM_UTF32_BE, 'utf_32_be'),
+             (codecs.BOM_UTF16_LE, 'utf_16_le'),
+             (codecs.BOM_UTF16_BE, 'utf_16_be'),
+             (codecs.BOM_UTF8, 'utf_8'))
+# Блок субтитра - подряд идущие непустые строки
+_SRT_BLOCK_RE = re.compile(r'(?:[^\r\n]*\S[^\r\n]*(?:\r\n|\r|\n|$))+')
+_SRT_TIMING_RE = re.compile(r'\s*([0-9]+)[:.,]([0-9]+)[:.,]([0-9]+)[:.,]([0-9]+)\s*-->\s*'
+                            r'([0-9]+)[:.,]([0-9]+)[:.,]([0-9]+)[:.,]([0-9]+)(?: +(.*))?$')
+_SRT_BLOCK_BYTES_RE = re.compile(rb'(?:[^\r\n]*\S[^\r\n]*(?:\r\n|\r|\n|$))+')
+
+def _detect_srt_encoding(head):
+    for bom, encoding in _SRT_BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+    return 'utf_8', 0
+
+def _parse_srt_block(lines):
+    """Разбор блока строк как в pysrt.SubRipItem.from_lines; None для некорректного блока."""
+    if len(lines) < 2:
+        return None
+    lines = [line.rstrip() for line in lines]
+    index = None
+    if '-->' not in lines[0]:
+        index = lines.pop(0)
+    try:
+        index = int(index)
+    except (TypeError, ValueError):
+        pass
+
+    match = _SRT_TIMING_RE.match(lines[0])
+    if match:
+        # Быстрый путь для обычной строки "00:00:01,000 --> 00:00:02,000"
+        h1, m1, s1, ms1, h2, m2, s2, ms2 = map(int, match.group(1, 2, 3, 4, 5, 6, 7, 8))
+        start = SrtTime.from_ordinal(h1 * 3600000 + m1 * 60000 + s1 * 1000 + ms1)
+        end = SrtTime.from_ordinal(h2 * 3600000 + m2 * 60000 + s2 * 1000 + ms2)
+        return Cue(index, start, end, '\n'.join(lines[1:]), (match.group(9) or '').strip())
+
+    timestamps = lines[0].split('-->')
+    if len(timestamps) != 2:
+        return None
+    end_and_position = timestamps[1].lstrip().split(' ', 1)
+    position = end_and_position[1].strip() if len(end_and_position) > 1 else ''
+    start, end = timestamps[0].strip(), end_and_position[0].strip()
+    try:
+        start = SrtTime.from_string(start) if start else SrtTime()
+        end = SrtTime.from_string(end) if end else SrtTime()
+    except ValueError:
+        return None
+    return Cue(index, start, end, '\n'.join(lines[1:]), position)
+
+def iter_srt(file_path, encoding=None):
+    """
+    Потоковое чтение SRT через mmap: субтитры выдаются по одному, по мере разбора.
+    Некорректные блоки пропускаются, как в pysrt (ERROR_PASS).
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            detected, bom_len = _detect_srt_encoding(mm[:4])
+            if encoding is None:
+                encoding = detected
+            elif codecs.lookup(encoding).name != codecs.lookup(detected).name:
+                bom_len = 0
+            if codecs.lookup(encoding).name == 'utf-8':
+                # Разбиваем на блоки прямо в отображенном файле и декодируем каждый блок отдельно
+                for match in _SRT_BLOCK_BYTES_RE.finditer(mm, bom_len):
+                    cue = _parse_srt_block(match.group().decode(encoding).splitlines())
+                    if cue is not None:
+                        yield cue
+            else:
+                text = codecs.decode(mm[bom_len:], encoding)
+                for match in _SRT_BLOCK_RE.finditer(text):
+                    cue = _parse_srt_block(match.group().splitlines())
+                    if cue is not None:
+                        yield cue
+
 def parse_srt(file_path):
+    """Чтение SRT в компактное хранилище CueStore."""
     try:
-        return pysrt.open(file_path)
+        with instrumentation.span('разбор SRT'):
+            return CueStore(iter_srt(file_path))
     except Exception as e:
         raise ValueError(f"Ошибка при парсинге SRT-файла: {e}")
 
+SIDECAR_SUFFIX = '.sidx'
+_SIDECAR_MAGIC = b'SIDX'
+_SIDECAR_VERSION = 3
+# Сигнатура, версия, порядок байт массивов, размер, время изменения (нс) и SHA-1 исходного SRT,
+# число субтитров, CRC32 данных после заголовка
+_SIDECAR_HEADER = struct.Struct('<4sHHQq20sII')
+_SIDECAR_SECTION = struct.Struct('<QQ')  # Смещение раздела от начала файла и число элементов
+_SIDECAR_CRC = struct.Struct('<I')
+# Разделы по порядку: имя и код типа элементов (как в array и memoryview.cast).
+# Таблицы строк (texts, cleans, lemmas, words) - границы строк и UTF-8 подряд; cleans и lemmas - очищенные
+# и лемматизированные texts; text_tokens - границы номеров слов (words) каждого текста в token_ids;
+# word_cues - границы номеров субтитров каждого слова в cue_ids (индекс слов корпуса);
+# text_ids - номер текста субтитра.
+_SIDECAR_SECTIONS = (
+    ('indexes', 'q'), ('starts', 'q'), ('ends', 'q'), ('text_ids', 'I'),
+    ('texts_offsets', 'I'), ('texts_data', 'B'),
+    ('cleans_offsets', 'I'), ('cleans_data', 'B'),
+    ('lemmas_offsets', 'I'), ('lemmas_data', 'B'),
+    ('words_offsets', 'I'), ('words_data', 'B'),
+    ('text_tokens', 'I'), ('token_ids', 'I'),
+    ('word_cues', 'I'), ('cue_ids', 'I'),
+)
+_SIDECAR_BYTEORDER = 1 if sys.byteorder == 'little' else 2
+
+def sidecar_path(srt_path):
+    """Файл .sidx рядом с SRT: Episode01.srt -> Episode01.sidx."""
+    return os.path.splitext(srt_path)[0] + SIDECAR_SUFFIX
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+def _string_table(strings):
+    offsets = array('I', [0])
+    data = bytearray()
+    for string in strings:
+        data += string.encode('utf-8', 'surrogatepass')
+        offsets.append(len(data))
+    return offsets, data
+
+def write_sidecar(srt_path, store, corpus=None, path=None):
+    """
+    Запись .sidx для SRT. store - субтитры в том виде, как они записаны в файле (без сдвигов таймкодов),
+    corpus - подготовленный по ним корпус; леммы всех текстов вычисляются, если их еще нет.
+    """
+    if not all(type(index) is int for index in store.indexes):
+        # Номер субтитра в SRT может отсутствовать (None) или быть не числом - такие файлы не индексируются
+        raise ValueError("в SRT есть субтитры без числового номера")
+    with instrumentation.span('запись .sidx'):
+        corpus = corpus if corpus is not None else SubtitleCorpus(store)
+        stat = os.stat(srt_path)
+        sha1 = file_sha1(srt_path)
+        texts, cleans, lemmas, words = {}, [], [], {}
+        text_ids = array('I')
+        text_tokens, token_ids = array('I', [0]), array('I')
+        for entry in corpus.entries:
+            text_id = texts.get(entry.text)
+            if text_id is None:
+                text_id = texts[entry.text] = len(texts)
+                cleans.append(entry.clean)
+                lemmas.append(entry.lemma)
+                token_ids.extend(words.setdefault(word, len(words)) for word in entry.words)
+                text_tokens.append(len(token_ids))
+            text_ids.append(text_id)
+        word_cues, cue_ids = array('I', [0]), array('I')
+        for word in words:
+            cue_ids.extend(corpus.index[word])
+            word_cues.append(len(cue_ids))
+        texts_offsets, texts_data = _string_table(texts)
+        cleans_offsets, cleans_data = _string_table(cleans)
+        words_offsets, words_data = _string_table(words)
+        lemmas_offsets, lemmas_data = _string_table(lemmas)
+        arrays = {
+            'indexes': array('q', store.indexes), 'starts': array('q', store.starts), 'ends': array('q', store.ends),
+            'text_ids': text_ids, 'texts_offsets': texts_offsets, 'texts_data': texts_data,
+            'cleans_offsets': cleans_offsets, 'cleans_data': cleans_data,
+            'words_offsets': words_offsets, 'words_data': words_data,
+            'lemmas_offsets': lemmas_offsets, 'lemmas_data': lemmas_data,
+            'text_tokens': text_tokens, 'token_ids': token_ids,
+            'word_cues': word_cues, 'cue_ids': cue_ids
+        }
+
+        header_size = _SIDECAR_HEADER.size + _SIDECAR_SECTION.size * len(_SIDECAR_SECTIONS) + _SIDECAR_CRC.size
+        sections = []
+        body = bytearray()
+        offset = header_size
+        for name, code in _SIDECAR_SECTIONS:
+            # Разделы выровнены по 8 байт, чтобы их можно было читать прямо из отображенного файла
+            padding = -offset % 8
+            body += bytes(padding)
+            offset += padding
+            data = arrays[name]
+            sections.append(_SIDECAR_SECTION.pack(offset, len(data)))
+            body += data
+            offset += len(data) * (data.itemsize if isinstance(data, array) else 1)
+        header = _SIDECAR_HEADER.pack(_SIDECAR_MAGIC, _SIDECAR_VERSION, _SIDECAR_BYTEORDER, stat.st_size,
+                                      stat.st_mtime_ns, sha1, len(store), zlib.crc32(body)) + b''.join(sections)
+        header += _SIDECAR_CRC.pack(zlib.crc32(header))
+
+        path = path or sidecar_path(srt_path)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(body)
+        os.replace(tmp_path, path)
+    return path
+
+class Sidecar:
+    """
+    Бинарный индекс SRT (.sidx): номера и таймкоды субтитров, таблицы строк (тексты, очищенные тексты,
+    слова, леммы), номера слов и лемм каждого текста и индекс слов корпуса. Файл отображается через mmap,
+    разделы читаются через memoryview поверх него. По нему CueStore и SubtitleCorpus строятся без разбора SRT,
+    без очистки текстов регулярными выражениями, без построения индекса слов и без pymorphy3.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.sections = {}
+        self._texts = None
+        view = memoryview(self._mmap)
+        try:
+            self._read_header(view)
+        except Exception:
+            # Пока на отображение есть memoryview, закрыть его нельзя
+            for section in self.sections.values():
+                section.release()
+            self.sections = {}
+            view.release()
+            self._mmap.close()
+            raise
+
+    def _read_header(self, view):
+        header_size = _SIDECAR_HEADER.size + _SIDECAR_SECTION.size * len(_SIDECAR_SECTIONS)
+        if len(view) < header_size + _SIDECAR_CRC.size:
+            raise ValueError("файл .sidx обрезан")
+        magic, version, byteorder, self.srt_size, self.srt_mtime_ns, self.srt_sha1, self.count, body_crc = \
+            _SIDECAR_HEADER.unpack_from(view)
+        if magic != _SIDECAR_MAGIC or version != _SIDECAR_VERSION or byteorder != _SIDECAR_BYTEORDER:
+            raise ValueError("файл .sidx другой версии или с другим порядком байт")
+        if zlib.crc32(view[:header_size]) != _SIDECAR_CRC.unpack_from(view, header_size)[0]:
+            raise ValueError("контрольная сумма заголовка .sidx не совпадает")
+        if zlib.crc32(view[header_size + _SIDECAR_CRC.size:]) != body_crc:
+            raise ValueError("контрольная сумма данных .sidx не совпадает")
+        for number, (name, code) in enumerate(_SIDECAR_SECTIONS):
+            offset, count = _SIDECAR_SECTION.unpack_from(view, _SIDECAR_HEADER.size + number * _SIDECAR_SECTION.size)
+            end = offset + count * struct.calcsize(code)
+            if end > len(view):
+                raise ValueError(f"раздел {name} выходит за конец файла .sidx")
+            self.sections[name] = view[offset:end].cast(code)
+        self._check_sections()
+
+    def _check_sections(self):
+        """Согласованность разделов: размеры, границы строк и номера в пределах таблиц."""
+        sections = self.sections
+
+        def check(condition, name):
+            if not condition:
+                raise ValueError(f"раздел {name} файла .sidx поврежден")
+
+        def check_bounds(name, limit):
+            bounds = sections[name]
+            check(len(bounds) >= 1 and bounds[0] == 0 and bounds[-1] <= limit
+                  and all(a <= b for a, b in zip(bounds, bounds[1:])), name)
+            return len(bounds) - 1
+
+        for name in ('indexes', 'starts', 'ends', 'text_ids'):
+            check(len(sections[name]) == self.count, name)
+        counts = {table: check_bounds(table + '_offsets', len(sections[table + '_data']))
+                  for table in ('texts', 'cleans', 'lemmas', 'words')}
+        check(counts['cleans'] == counts['texts'], 'cleans_offsets')
+        check(counts['lemmas'] == counts['texts'], 'lemmas_offsets')
+        check(check_bounds('word_cues', len(sections['cue_ids'])) == counts['words'], 'word_cues')
+        check(max(sections['cue_ids'], default=-1) < self.count, 'cue_ids')
+        check(check_bounds('text_tokens', len(sections['token_ids'])) == counts['texts'], 'text_tokens')
+        for name, table in (('text_ids', 'texts'), ('token_ids', 'words')):
+            check(max(sections[name], default=-1) < counts[table], name)
+
+    def close(self):
+        """Освобождение отображения файла (построенные store() и corpus() от него не зависят)."""
+        for section in self.sections.values():
+            section.release()
+        self.sections = {}
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @classmethod
+    def open(cls, srt_path, path=None):
+        """Индекс SRT, если он есть и записан по текущему содержимому файла; иначе None."""
+        path = path or sidecar_path(srt_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            sidecar = cls(path)
+        except (OSError, ValueError):
+            return None
+        if sidecar.matches(srt_path):
+            return sidecar
+        sidecar.close()
+        return None
+
+    def matches(self, srt_path):
+        """Записан ли индекс по этому SRT: размер и время изменения, при расхождении времени - SHA-1."""
+        try:
+            stat = os.stat(srt_path)
+            if stat.st_size != self.srt_size:
+                return False
+            return stat.st_mtime_ns == self.srt_mtime_ns or file_sha1(srt_path) == self.srt_sha1
+        except OSError:
+            return False
+
+    def strings(self, table):
+        """Строки таблицы texts, cleans, lemmas или words."""
+        offsets = self.sections[table + '_offsets']
+        data = self.sections[table + '_data']
+        return [str(data[offsets[i]:offsets[i + 1]], 'utf-8', 'surrogatepass') for i in range(len(offsets) - 1)]
+
+    def texts(self):
+        if self._texts is None:
+            self._texts = self.strings('texts')
+        return self._texts
+
+    def store(self):
+        """CueStore из индекса (таймкоды копируются: хранилище их меняет при сдвигах)."""
+        sections = self.sections
+        texts = self.texts()
+        store = CueStore()
+        store.starts = array('l', sections['starts'])
+        store.ends = array('l', sections['ends'])
+        store.texts = [texts[text_id] for text_id in sections['text_ids']]
+        store.indexes = sections['indexes'].tolist()
+        return store
+
+    def corpus(self, store=None):
+        """
+        SubtitleCorpus с готовыми очищенными текстами, словами, леммами и индексом слов из .sidx.
+        store - хранилище из store() (или с теми же текстами в том же порядке, например после сдвигов таймкодов).
+        Строки и номера копируются из отображения (номера слов - одним блоком, а срезы по текстам
+        делаются уже по копии), чтобы после построения файл можно было закрыть.
+        """
+        sections = self.sections
+        store = store if store is not None else self.store()
+        texts = self.texts()
+        words = self.strings('words')
+        # Слова текста - очищенный текст, разбитый по пробелам (как в CompiledText)
+        compiled = {text: CompiledText.prepared(text, clean, clean.split(), lemma)
+                    for text, clean, lemma in zip(texts, self.strings('cleans'), self.strings('lemmas'))}
+        text_tokens = sections['text_tokens']
+        token_ids = memoryview(sections['token_ids'].tobytes()).cast('I')
+        tokens = [token_ids[text_tokens[text_id]:text_tokens[text_id + 1]] for text_id in range(len(texts))]
+        word_cues, cue_ids = sections['word_cues'], sections['cue_ids']
+        index = {word: cue_ids[word_cues[word_id]:word_cues[word_id + 1]].tolist()
+                 for word_id, word in enumerate(words)}
+        corpus = SubtitleCorpus(store, texts=compiled, index=index)
+        vocabulary = {word: word_id for word_id, word in enumerate(words)}
+        corpus._token_ids = (vocabulary, [tokens[text_id] for text_id in sections['text_ids']])
+        return corpus
+
+def load_srt(path, sidecar=True, errors=None):
+    """
+    Хранилище и корпус субтитров SRT. С sidecar=True берется актуальный .sidx рядом с файлом,
+    а если его нет - SRT разбирается, леммы вычисляются, и индекс записывается для следующего раза.
+    Ошибки чтения и записи .sidx не прерывают загрузку (используется разобранный SRT):
+    их описания добавляются в список errors, если он передан.
+    """
+    if sidecar:
+        with instrumentation.span('чтение .sidx'):
+            try:
+                index = Sidecar.open(path)
+                if index is not None:
+                    with index:
+                        store = index.store()
+                        return store, index.corpus(store)
+            except Exception as e:
+                if errors is not None:
+                    errors.append(f"Не удалось прочитать {sidecar_path(path)}: {e}")
+    store = parse_srt(path)
+    corpus = SubtitleCorpus(store)
+    if sidecar:
+        try:
+            write_sidecar(path, store, corpus)
+        except Exception as e:
+            if errors is not None:
+                errors.append(f"Не удалось записать {sidecar_path(path)}: {e}")
+    return store, corpus
+
+class CueRegistry:
+    """
+    Субтитры сессии: SRT разбирается один раз, дальше субтитр находится за O(1)
+    по его номеру в хранилище (cue id) или по тексту.
+    Одинаковые тексты хранятся списком номеров, поэтому повторяющиеся реплики различаются.
+    """
+
+    def __init__(self, path, store=None, sidecar=False):
+        self.path = path
+        self._corpus = None
+        self.sidecar_errors = []  # Ошибки чтения или записи .sidx (SRT при этом разобран обычным путем)
+        if store is None and sidecar:
+            # Уже встречавшийся SRT читается из .sidx вместе с леммами
+            store, self._corpus = load_srt(path, errors=self.sidecar_errors)
+        self.store = store if store is not None else parse_srt(path)
+        self.by_text = {}
+        for cue_id, text in enumerate(self.store.texts):
+            self.by_text.setdefault(text, []).append(cue_id)
+
+    def corpus(self):
+        """Подготовленный к поиску корпус; строится один раз на сессию."""
+        if self._corpus is None:
+            self._corpus = SubtitleCorpus(self.store)
+        return self._corpus
+
+    def resolve(self, cue_id, text):
+        """
+        Субтитр строки таблицы: по номеру, а для строк без номера - первый с таким текстом.
+        Номер не используется, если под ним теперь другой известный текст (файл перечитан после правки).
+        """
+        if cue_id is not None and 0 <= cue_id < len(self.store) and \
+                (self.store.texts[cue_id] == text or text not in self.by_text):
+            return self.store[cue_id]
+        cue_ids = self.by_text.get(text)
+        return self.store[cue_ids[0]] if cue_ids else None
+
+    def search(self, fragment):
+        """Первый субтитр, содержащий фрагмент (без учета регистра)."""
+        fragment = fragment.lower()
+        for cue_id, text in enumerate(self.store.texts):
+            if fragment in text.lower():
+                return self.store[cue_id]
+        return None
+
+class InputLoader:
+    """
+    Общий загрузчик входных файлов сессии: SRT, фразы и стоп-слова читаются одновременно
+    в пуле потоков (на сетевом диске каждое открытие файла дорого). Разобранный результат
+    кэшируется по (вид, путь) и отдается всем задачам, пока у файла те же время изменения и размер.
+    Результаты общие, менять их нельзя (кроме таймкодов в реестре субтитров - это состояние сессии).
+
+    Виды файлов: 'srt' - CueRegistry, 'phrases' - список фраз, 'stop_words' - множество
+    (отсутствующий файл стоп-слов дает пустое множество), 'sha1' - SHA-1 содержимого.
+    """
+
+    def __init__(self, max_workers=4, sidecar=False):
+        self.sidecar = sidecar  # Реестры субтитров читаются через .sidx
+        self.loaders = {
+            'srt': lambda path: CueRegistry(path, sidecar=self.sidecar),
+            'phrases': read_phrases,
+            'stop_words': read_stop_words,
+            'sha1': file_sha1
+        }
+        self.missing = {'stop_words': frozenset()}  # Виды необязательных файлов и значение для отсутствующего
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='input')
+        self._lock = threading.Lock()
+        self._cache = {}  # (вид, путь) -> (время изменения, размер, Future)
+
+    def _submit(self, kind, path, stat):
+        """Future с результатом: из кэша, если файл не менялся, иначе - новая загрузка в пуле."""
+        key = (kind, path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            future = self._executor.submit(self.loaders[kind], path)
+            self._cache[key] = (version, future)
+        return future
+
+    def _forget(self, kind, path, future):
+        # Неудачная загрузка не кэшируется: при следующем запросе файл читается заново
+        with self._lock:
+            cached = self._cache.get((kind, path))
+            if cached is not None and cached[1] is future:
+                del self._cache[(kind, path)]
+
+    def prefetch(self, *requests):
+        """Загрузка файлов (вид, путь) в фоне, без ожидания; ошибки проявятся при load."""
+        for kind, path in requests:
+            self._executor.submit(self._prefetch, kind, path)
+
+    def _prefetch(self, kind, path):
+        try:
+            self._submit(kind, path, os.stat(path))
+        except OSError:
+            pass
+
+    def load(self, *requests):
+        """
+        Результаты для запросов (вид, путь) в том же порядке. Файлы проверяются (os.stat)
+        и читаются одновременно; уже загруженные и не изменившиеся берутся из кэша.
+        """
+        with instrumentation.span('загрузка файлов'):
+            stats = [self._executor.submit(os.stat, path) for kind, path in requests]
+            futures = []
+            for (kind, path), stat in zip(requests, stats):
+                try:
+                    futures.append(self._submit(kind, path, stat.result()))
+                except FileNotFoundError:
+                    if kind not in self.missing:
+                        raise
+                    futures.append(None)
+            results = []
+            for (kind, path), future in zip(requests, futures):
+                if future is None:
+                    results.append(self.missing[kind])
+                    continue
+                try:
+                    results.append(future.result())
+                except Exception:
+                    self._forget(kind, path, future)
+                    raise
+            return results
+
+    def get(self, kind, path):
+        return self.load((kind, path))[0]
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+class LemmaCache:
+    """
+    Кэш слово -> лемма с ограничением размера (вытесняются давно не использованные слова).
+    Может сохраняться на диск, чтобы повторные сессии по тому же сериалу начинались с прогретым кэшем.
+    """
+
+    VERSION = 1
+
+    def __init__(self, maxsize=50000, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._new = None  # Вычисленные леммы для take_new (учет включается первым вызовом take_new)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def lemma(self, word):
+        with self._lock:
+            value = self._data.get(word)
+            if value is not None:
+                self._data.move_to_end(word)
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = get_morph().parse(word)[0].normal_form
+        with self._lock:
+            self._data[word] = value
+            self._evict()
+            if self._new is not None:
+                self._new[word] = value
+        return value
+
+    @property
+    def lookups(self):
+        return self.hits + self.misses
+
+    def _evict(self):
+        while self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def resize(self, maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def take_new(self):
+        """
+        Леммы, вычисленные с прошлого вызова (например, в процессе пакетной обработки - для передачи
+        в родительский процесс, который сохраняет общий кэш). Первый вызов включает учет и возвращает {}.
+        """
+        with self._lock:
+            new, self._new = self._new or {}, {}
+        return new
+
+    def update(self, lemmas):
+        """Добавление готовых лемм (слово -> лемма), например, полученных из других процессов."""
+        with self._lock:
+            for word, value in lemmas.items():
+                self._data[word] = value
+                self._data.move_to_end(word)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def load(self, path=None):
+        """Загрузка кэша с диска; несовместимый или поврежденный файл игнорируется."""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != self.VERSION:
+                return False
+            with self._lock:
+                for word, value in data.get('lemmas', []):
+                    self._data[word] = value
+                    self._data.move_to_end(word)
+                self._evict()
+            return True
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Ошибка при загрузке кэша лемм: {e}")
+            return False
+
+    def save(self, path=None):
+        """Сохранение кэша на диск (от давно использованных слов к недавним)."""
+        path = path or self.path
+        if not path:
+            return False
+        with self._lock:
+            lemmas = list(self._data.items())
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'lemmas': lemmas}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return True
+
+lemma_cache = LemmaCache()
+
+def configure_lemma_cache(maxsize=None, path=None):
+    """Настройка общего кэша лемм (из config.ini); при указании пути кэш загружается с диска."""
+    if maxsize is not None:
+        lemma_cache.resize(maxsize)
+    if path:
+        lemma_cache.path = path
+        lemma_cache.load()
+    return lemma_cache
+
 def normalize_text(text):
     text = text.strip().lower()
     words = re.findall(r'\w+', text)
-    normalized = [morph.parse(word)[0].normal_form for word in words]
+    normalized = [lemma_cache.lemma(word) for word in words]
     return ' '.join(normalized)
 
+DEFAULT_STOP_WORDS = frozenset([
+    "the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by",
+    "is", "are", "was", "were", "be", "have", "has", "had", "do", "does", "did",
+    "will", "would", "shall", "should", "can", "could", "may", "might",
+    "don't", "won't", "can't", "didn't", "doesn't", "i'm", "you're", "he's", "she's", "it's",
+    "и", "в", "на", "с", "к", "у", "по", "из", "а", "но", "что", "это", "как", "для"
+])
+
+def fingerprint_words(words):
+    """Хэш набора слов, не зависящий от порядка (и от PYTHONHASHSEED, в отличие от hash())."""
+    return hashlib.sha1('\n'.join(sorted(words)).encode('utf-8')).hexdigest()
+
+def read_stop_words(file_path):
+    """Стоп-слова из файла: по одному слову в строке."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        return {word.strip().lower() for word in f.read().splitlines() if word.strip()}
+
+def read_phrases(file_path):
+    """Непустые строки файла фраз без пробелов по краям."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
 def format_srt_entry(index, start, end, text):
     start_str = f"{start.hours:02d}:{start.minutes:02d}:{start.seconds:02d},{start.milliseconds:03d}"
     end_str = f"{end.hours:02d}:{end.minutes:02d}:{end.seconds:02d},{end.milliseconds:03d}"
     return f"{index}\n{start_str} --> {end_str}\n{text}\n\n"
 
-def calculate_exact_timestamps(subtitle, phrase):
+# Для строк такой длины SequenceMatcher включает autojunk и результаты могут отличаться
+MAX_SUBSTRING_PHRASE = 199
+
+def _longest_common_substring(a, b):
+    """
+    Наибольшая общая подстрока a и b: (начало в a, длина) - та же, что дает
+    SequenceMatcher(None, a, b).find_longest_match для b не длиннее MAX_SUBSTRING_PHRASE
+    (самая ранняя в a, при равенстве - самая ранняя в b). Длина подбирается двоичным поиском,
+    подстроки ищутся str.find, поэтому для коротких фраз это много быстрее SequenceMatcher.
+    """
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        size = (low + high + 1) // 2
+        if any(b[j:j + size] in a for j in range(len(b) - size + 1)):
+            low = size
+        else:
+            high = size - 1
+    if not low:
+        return 0, 0
+    return min(a.find(b[j:j + low]) for j in range(len(b) - low + 1) if b[j:j + low] in a), low
+
+def _phrase_ratios(cue, phrase):
+    """
+    Доли длительности субтитра (начало, конец), на которые приходится фраза,
+    или None, если фраза не найдена и берется весь субтитр.
+    """
+    word_count = len(cue.lemma_offsets)
+    phrase_len = len(phrase.lemma_offsets)
+    i = cue.find_lemma_words(phrase)
+    if i is not None:
+        return i / word_count, (i + phrase_len) / word_count
+
+    norm_subtitle = cue.lemma
+    norm_phrase = phrase.lemma
+    if len(norm_phrase) <= MAX_SUBSTRING_PHRASE:
+        start, size = _longest_common_substring(norm_subtitle, norm_phrase)
+    else:
+        matcher = SequenceMatcher(None, norm_subtitle, norm_phrase)
+        start, _, size = matcher.find_longest_match(0, len(norm_subtitle), 0, len(norm_phrase))
+    if size > 0:
+        return start / len(norm_subtitle), (start + size) / len(norm_subtitle)
+    return None
+
+def _timestamps_from_ratios(subtitle, ratios):
     start_time = subtitle.start
     end_time = subtitle.end
+    if ratios is None:
+        return start_time, end_time
     total_duration_ms = (end_time - start_time).ordinal
+    start_ratio, end_ratio = ratios
+    start_ms = start_time.ordinal + int(total_duration_ms * start_ratio)
+    end_ms = start_time.ordinal + int(total_duration_ms * end_ratio)
+    return SrtTime.from_ordinal(start_ms), SrtTime.from_ordinal(end_ms)
 
-    norm_subtitle = normalize_text(subtitle.text)
-    norm_phrase = normalize_text(phrase)
-
-    sub_words = norm_subtitle.split()
-    phrase_words = norm_phrase.split()
-    phrase_len = len(phrase_words)
-
-    for i in range(len(sub_words) - phrase_len + 1):
-        window = ' '.join(sub_words[i:i + phrase_len])
-        if window == norm_phrase:
-            start_ratio = i / len(sub_words)
-            end_ratio = (i + phrase_len) / len(sub_words)
-            start_ms = start_time.ordinal + int(total_duration_ms * start_ratio)
-            end_ms = start_time.ordinal + int(total_duration_ms * end_ratio)
-            return (pysrt.SubRipTime.from_ordinal(start_ms),
-                    pysrt.SubRipTime.from_ordinal(end_ms))
-
-    from difflib import SequenceMatcher
-    matcher = SequenceMatcher(None, norm_subtitle, norm_phrase)
-    match = matcher.find_longest_match(0, len(norm_subtitle), 0, len(norm_phrase))
-    if match.size > 0:
-        start_ratio = match.a / len(norm_subtitle)
-        end_ratio = (match.a + match.size) / len(norm_subtitle)
-        start_ms = start_time.ordinal + int(total_duration_ms * start_ratio)
-        end_ms = start_time.ordinal + int(total_duration_ms * end_ratio)
-        return (pysrt.SubRipTime.from_ordinal(start_ms),
-                pysrt.SubRipTime.from_ordinal(end_ms))
-
-    return start_time, end_time
+def calculate_exact_timestamps(subtitle, phrase, cue=None):
+    """
+    Точные таймкоды фразы внутри субтитра. phrase - строка или CompiledPhrase,
+    cue - подготовленный текст субтитра из SubtitleCorpus (если есть).
+    """
+    cue = cue if cue is not None else compile_text(subtitle.text)
+    return _timestamps_from_ratios(subtitle, _phrase_ratios(cue, compile_phrase(phrase)))
+
+def calculate_timestamps_batch(pairs, corpus=None):
+    """
+    Таймкоды для списка пар (субтитр, фраза) - те же, что у calculate_exact_timestamps.
+    Каждая фраза и каждый текст субтитра лемматизируются один раз (тексты берутся из corpus,
+    если он передан), положение фразы ищется один раз на пару (текст, фраза).
+    """
+    corpus = corpus if corpus is not None else SubtitleCorpus([])
+    phrases = {}
+    ratios = {}
+    result = []
+    for subtitle, phrase in pairs:
+        compiled_phrase = phrases.get(phrase)
+        if compiled_phrase is None:
+            compiled_phrase = phrases[phrase] = compile_phrase(phrase)
+        key = (subtitle.text, compiled_phrase.text)
+        if key not in ratios:
+            ratios[key] = _phrase_ratios(corpus.lookup(subtitle.text), compiled_phrase)
+        result.append(_timestamps_from_ratios(subtitle, ratios[key]))
+    return result
 
 def sort_subtitles_by_time(subtitles):
-    return sorted(subtitles, key=lambda x: x.start.ordinal)
\ No newline at end of file
+    if isinstance(subtitles, CueStore):
+        return subtitles.sorted_by_time()
+    return sorted(subtitles, key=lambda x: x.start_ms)
\ No newline at end of file